@@ -0,0 +1,169 @@
+from __future__ import annotations
+import hashlib
+import marshal
+import os
+import sys
+import time
+from typing import Any, Optional
+from Lexer import TokenType
+from Parser import Atom, Cons, Expression, Parser, Symbol, make_atom
+from std import NIL, build_list, iterate_over_atom, make_array, make_hash_table, sethash
+
+
+# bump whenever the parsed representation or the encoding below changes
+FORMAT = 5
+
+UNTYPED = -1
+
+DEFAULT_DIRECTORY = os.environ.get(
+    "MINIMALISP_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "minimalisp")
+)
+
+
+def encode(atom: Atom) -> Any:
+    # expressions become lists, every other atom a (type, value) tuple, and
+    # quoted lists are flattened so long lists do not nest
+    if atom is NIL:
+        return None
+
+    if isinstance(atom, Expression):
+        return [encode(a) for a in atom.value]
+
+    if atom.type == TokenType.LIST:
+        items = []
+        while atom.__class__ is Cons:
+            items.append(encode(atom.value))
+            atom = atom.cdr
+
+        return (TokenType.LIST.value, items, encode(atom))
+
+    if atom.type == TokenType.ARRAY:
+        return (TokenType.ARRAY.value, [encode(a) for a in iterate_over_atom(None, atom)])
+
+    if atom.type == TokenType.HASH_TABLE:
+        return (TokenType.HASH_TABLE.value, [(encode(k), encode(v)) for k, v in atom.value.values()])
+
+    if atom.type is None:
+        # results of python builtins are left untyped
+        return (UNTYPED, atom.value)
+
+    return (atom.type.value, atom.value)
+
+
+def decode(data: Any) -> Atom:
+    if data is None:
+        return NIL
+
+    if isinstance(data, list):
+        return Expression([decode(d) for d in data])
+
+    if data[0] == UNTYPED:
+        return Atom(value=data[1])
+
+    type = TokenType(data[0])
+
+    if type == TokenType.LIST:
+        return build_list([decode(d) for d in data[1]], end=decode(data[2]))
+
+    if type == TokenType.ARRAY:
+        return make_array([decode(d) for d in data[1]])
+
+    if type == TokenType.HASH_TABLE:
+        table = make_hash_table(None)
+        for key, value in data[1]:
+            sethash(None, decode(key), table, decode(value))
+        return table
+
+    if type == TokenType.SPECIAL:
+        return Symbol(value=data[1], type=type)
+
+    return make_atom(data[1], type)
+
+
+class Cache:
+    def __init__(self, directory: str = DEFAULT_DIRECTORY) -> None:
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0
+
+    def Key(self, code: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(f"{FORMAT}:{sys.version_info[:2]}:{marshal.version}:".encode())
+        digest.update(code.encode())
+        return digest.hexdigest()
+
+    def Path(self, key: str, name: str = "") -> str:
+        return os.path.join(self.directory, f"{name}{'-' if name else ''}{key}.mlc")
+
+    def Load(self, path: str) -> Optional[tuple[float, list[Atom]]]:
+        try:
+            with open(path, "rb") as f:
+                format, seconds, atoms = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if format != FORMAT:
+            return None
+
+        return seconds, [decode(atom) for atom in atoms]
+
+    def Store(self, path: str, seconds: float, atoms: list[Atom]):
+        os.makedirs(self.directory, exist_ok=True)
+
+        # written to a temporary file first so readers never see half of it
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as f:
+            marshal.dump((FORMAT, seconds, [encode(atom) for atom in atoms]), f)
+        os.replace(temporary, path)
+
+    def Prune(self, name: str, keep: str):
+        # entries for an older version of the same named source are stale
+        try:
+            entries = os.listdir(self.directory)
+        except OSError:
+            return
+
+        for entry in entries:
+            if entry.startswith(f"{name}-") and entry != os.path.basename(keep):
+                try:
+                    os.remove(os.path.join(self.directory, entry))
+                except OSError:
+                    pass
+
+    def Read(self, parser: Parser, code: str, name: str = "") -> Parser:
+        path = self.Path(self.Key(code), name)
+
+        start = time.perf_counter()
+        if (cached := self.Load(path)) is not None:
+            seconds, atoms = cached
+            parser.atoms.extend(atoms)
+            self.hits += 1
+            self.saved += seconds - (time.perf_counter() - start)
+            return parser
+
+        self.misses += 1
+        start = time.perf_counter()
+        count = len(parser.atoms)
+        parser.Read(code)
+        self.Store(path, time.perf_counter() - start, parser.atoms[count:])
+
+        if name:
+            self.Prune(name, path)
+
+        return parser
+
+    def ReadFile(self, parser: Parser, filename: str) -> Parser:
+        with open(filename, "r") as f:
+            code = f.read()
+
+        # named after the file so a changed file replaces its old entry
+        location = hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[:8]
+        name = f"{os.path.basename(filename).replace('-', '_')}_{location}"
+        return self.Read(parser, code, name)
+
+    def Report(self) -> str:
+        return (
+            f"cache hits={self.hits} misses={self.misses} "
+            f"saved={self.saved * 1000:.2f}ms"
+        )
@@ -0,0 +1,551 @@
+from __future__ import annotations
+from typing import Callable, Iterable, Optional, Union
+from Lexer import SYMBOL
+from Parser import Atom, Context, Expression, Function, integer
+from std import NIL, arity_error, reserved, iterate_over_atom, lambda_form, open_file, setter, with_output_to_string_form
+from Memo import memo_spec, memoize
+from Profiler import Profiled
+
+
+# a frame is a flat list: the enclosing frame, the global context, then one
+# slot per variable bound by defun, lambda, let, do, dotimes or dolist.
+# Variables are read by the (depth, slot) coordinates the compiler resolved;
+# anything else is looked up by name in the context.
+Frame = list
+
+PARENT = 0
+CTX = 1
+SLOTS = 2
+
+Compiled = Callable[[Frame], Atom]
+
+
+def root_frame(ctx: Context) -> Frame:
+    return [None, ctx]
+
+
+def frame_get(frame: Frame, depth: int, slot: int) -> Atom:
+    for _ in range(depth):
+        frame = frame[PARENT]
+    return frame[slot]
+
+
+def frame_set(frame: Frame, depth: int, slot: int, value: Atom):
+    for _ in range(depth):
+        frame = frame[PARENT]
+    frame[slot] = value
+
+
+class Scope:
+    def __init__(self, names: Iterable[str], parent: Scope = None) -> None:
+        self.names = list(names)
+        self.parent = parent
+
+    def Resolve(self, name: str) -> Optional[tuple[int, int]]:
+        scope, depth = self, 0
+        while scope is not None:
+            if name in scope.names:
+                return depth, scope.names.index(name) + SLOTS
+            scope, depth = scope.parent, depth + 1
+
+        return None
+
+    def Declare(self, name: str) -> int:
+        if name not in self.names:
+            self.names.append(name)
+        return self.names.index(name) + SLOTS
+
+    def Addresses(self) -> dict[str, tuple[int, int]]:
+        addresses = {}
+        scope, depth = self, 0
+        while scope is not None:
+            for slot, name in enumerate(scope.names):
+                addresses.setdefault(name, (depth, slot + SLOTS))
+            scope, depth = scope.parent, depth + 1
+
+        return addresses
+
+
+class Bridge(Context):
+    # exposes the lexical variables of a frame by name, for special forms
+    # that only have a tree-walking implementation
+    __slots__ = ("addresses", "frame")
+
+    def __init__(self, scope: Scope, frame: Frame) -> None:
+        super().__init__(parent=frame[CTX])
+        self.addresses = scope.Addresses()
+        self.frame = frame
+
+    def Get(self, key: str) -> Atom:
+        if key in self.scope:
+            return self.scope[key]
+
+        if (address := self.addresses.get(key)) is not None:
+            return frame_get(self.frame, *address)
+
+        return self.parent.Get(key)
+
+    def FindAndSet(self, key: str, value: Atom) -> Atom:
+        if key in self.scope:
+            self.scope[key] = value
+            return
+
+        if (address := self.addresses.get(key)) is not None:
+            return frame_set(self.frame, *address, value)
+
+        return self.parent.FindAndSet(key, value)
+
+
+class Closure(Function):
+    # a function compiled from defun or lambda. value is the entry point for
+    # every caller outside compiled code and runs the trampoline; enter runs
+    # the body once and may return a TailCall for the trampoline to resume
+    __slots__ = ("enter",)
+
+    def __init__(
+        self,
+        value: Callable,
+        enter: Callable[[list[Atom]], Atom],
+        form: Expression = None,
+    ) -> None:
+        super().__init__(value, form)
+        self.enter = enter
+
+
+class TailCall:
+    __slots__ = ("function", "args")
+
+    def __init__(self, function: Union[Atom, Callable], args: list[Atom]) -> None:
+        self.function = function
+        self.args = args
+
+    def Resume(self, ctx: Context) -> Atom:
+        function = self.function
+        if function.__class__ is Closure:
+            return function.enter(self.args)
+        if function.__class__ is Profiled and function.enter is not None:
+            return function.enter(self.args)
+
+        if isinstance(function, Function):
+            function = function.value
+        return function(ctx, *self.args)
+
+
+class Compiler:
+    def __init__(self, ctx: Context) -> None:
+        self.ctx = ctx
+        self.forms = {
+            "defun": self.Defun,
+            "defun-memo": self.DefunMemo,
+            "lambda": self.Lambda,
+            "progn": self.Progn,
+            "if": self.If,
+            "when": self.When,
+            "cond": self.Cond,
+            "let": self.Let,
+            "do": self.Do,
+            "dotimes": self.Dotimes,
+            "dolist": self.Dolist,
+            "loop": self.Loop,
+            "defvar": self.Defvar,
+            "setf": self.Setf,
+            "with-output-to-string": self.WithOutputToString,
+            "with-open-file": self.WithOpenFile,
+        }
+
+    def Builtin(self, name: str) -> Union[Atom, Callable, None]:
+        # a name can be bound once at compile time if it resolves to the
+        # builtin layer and no user context in between defines it
+        ctx = self.ctx
+        while ctx is not None:
+            if name in ctx.scope:
+                return ctx.scope[name] if ctx.builtin else None
+            ctx = ctx.parent
+
+        return None
+
+    def Compile(self, atom: Atom, scope: Scope = None, tail: bool = False) -> Compiled:
+        if isinstance(atom, Expression):
+            return self.Expression(atom, scope, tail)
+
+        if atom.type is SYMBOL:
+            return self.Load(atom.value, scope)
+
+        return lambda _frame: atom
+
+    def Load(self, name: str, scope: Scope) -> Compiled:
+        if scope is None or (address := scope.Resolve(name)) is None:
+            builtin = self.Builtin(name)
+            if isinstance(builtin, Atom) and not isinstance(builtin, Function):
+                return lambda _frame: builtin
+
+            return lambda frame: frame[CTX].Get(name)
+
+        depth, slot = address
+
+        if depth == 0:
+            return lambda frame: frame[slot]
+
+        if depth == 1:
+            return lambda frame: frame[PARENT][slot]
+
+        if depth == 2:
+            return lambda frame: frame[PARENT][PARENT][slot]
+
+        return lambda frame: frame_get(frame, depth, slot)
+
+    def Store(self, name: str, scope: Scope) -> Callable[[Frame, Atom], None]:
+        if scope is None or (address := scope.Resolve(name)) is None:
+
+            def store(frame: Frame, value: Atom):
+                frame[CTX].FindAndSet(name, value)
+
+            return store
+
+        depth, slot = address
+
+        if depth == 0:
+
+            def store(frame: Frame, value: Atom):
+                frame[slot] = value
+
+            return store
+
+        return lambda frame, value: frame_set(frame, depth, slot, value)
+
+    def Body(self, body: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        forms = [self.Compile(b, scope) for b in body[:-1]]
+        forms += [self.Compile(b, scope, tail) for b in body[-1:]]
+
+        if not forms:
+            return lambda _frame: NIL
+
+        if len(forms) == 1:
+            return forms[0]
+
+        def progn(frame: Frame) -> Atom:
+            for form in forms:
+                result = form(frame)
+            return result
+
+        return progn
+
+    def Expression(self, expression: Expression, scope: Scope, tail: bool) -> Compiled:
+        if not expression.value:
+            return lambda _frame: NIL
+
+        head, *args = expression.value
+
+        # a form removed from a restricted context is left unbound
+        if head.type is SYMBOL and head.value in reserved and self.Builtin(head.value) is not None:
+            if form := self.forms.get(head.value):
+                return form(args, scope, tail)
+
+            special = reserved[head.value]
+
+            if scope is None:
+                return lambda frame: special(frame[CTX], *args)
+
+            return lambda frame: special(Bridge(scope, frame), *args)
+
+        args = [self.Compile(arg, scope) for arg in args]
+
+        if head.type is SYMBOL and not (scope and scope.Resolve(head.value)):
+            function = self.Builtin(head.value)
+            if isinstance(function, Function):
+                function = function.value
+            if callable(function):
+                return self.Call(function, args)
+
+        head = self.Compile(head, scope)
+
+        if tail:
+            # calls in tail position hand the callee back to the trampoline of
+            # the enclosing function instead of growing the Python stack
+            return lambda frame: TailCall(head(frame), [arg(frame) for arg in args])
+
+        def call(frame: Frame) -> Atom:
+            function = head(frame)
+            if isinstance(function, Function):
+                function = function.value
+            return function(frame[CTX], *[arg(frame) for arg in args])
+
+        return call
+
+    @staticmethod
+    def Call(function: Callable, args: list[Compiled]) -> Compiled:
+        if len(args) == 0:
+            return lambda frame: function(frame[CTX])
+
+        if len(args) == 1:
+            a = args[0]
+            return lambda frame: function(frame[CTX], a(frame))
+
+        if len(args) == 2:
+            a, b = args
+            return lambda frame: function(frame[CTX], a(frame), b(frame))
+
+        return lambda frame: function(frame[CTX], *[arg(frame) for arg in args])
+
+    def Defun(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        return self.Define(args[0].value, args[1:], scope)
+
+    def DefunMemo(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        name, size = memo_spec(args[0])
+        return self.Define(name, args[1:], scope, lambda f: memoize(f, name, size))
+
+    def Define(
+        self, name: str, args: list[Atom], scope: Scope, wrap: Callable = None
+    ) -> Compiled:
+        # a defun inside a body binds its name in the enclosing frame, declared
+        # first so the body can call itself through that slot
+        slot = scope.Declare(name) if scope is not None else None
+
+        _lambda = self.Lambda(args, scope)
+        function = _lambda if wrap is None else lambda frame: wrap(_lambda(frame))
+
+        if slot is None:
+
+            def defun(frame: Frame) -> Atom:
+                f = function(frame)
+                frame[CTX].Set(name, f)
+                return f
+
+            return defun
+
+        def defun(frame: Frame) -> Atom:
+            f = function(frame)
+            frame[slot] = f
+            return f
+
+        return defun
+
+    def Lambda(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        inner = Scope([param.value for param in args[0].value], scope)
+        body = self.Body(args[1:], inner, tail=True)
+        size = len(inner.names)
+        arity = len(args[0].value)
+        form = lambda_form(args[0], args[1:])
+
+        def _lambda(frame: Frame) -> Atom:
+            ctx = frame[CTX]
+
+            def enter(params: list[Atom]) -> Atom:
+                if len(params) == size:
+                    return body([frame, ctx, *params])
+
+                if len(params) < arity:
+                    raise arity_error(arity, len(params))
+                local = [frame, ctx, *params[:size]]
+                local.extend([None] * (size + SLOTS - len(local)))
+                return body(local)
+
+            def func(_, *params) -> Atom:
+                result = enter(params)
+                while result.__class__ is TailCall:
+                    result = result.Resume(ctx)
+                return result
+
+            return Closure(func, enter, form)
+
+        return _lambda
+
+    def Progn(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        return self.Body(args, scope, tail)
+
+    def If(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        condition = self.Compile(args[0], scope)
+        then = self.Compile(args[1], scope, tail)
+        _else = self.Compile(args[2], scope, tail) if len(args) > 2 else None
+
+        def _if(frame: Frame) -> Atom:
+            if condition(frame) != NIL:
+                return then(frame)
+            if _else is not None:
+                return _else(frame)
+            return NIL
+
+        return _if
+
+    def When(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        condition = self.Compile(args[0], scope)
+        body = self.Body(args[1:], scope, tail)
+
+        def _when(frame: Frame) -> Atom:
+            if condition(frame) != NIL:
+                return body(frame)
+            return NIL
+
+        return _when
+
+    def Cond(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        clauses = [
+            (self.Compile(pair.value[0], scope), self.Body(pair.value[1:], scope, tail))
+            for pair in args
+        ]
+
+        def cond(frame: Frame) -> Atom:
+            for condition, body in clauses:
+                if condition(frame) != NIL:
+                    return body(frame)
+            return NIL
+
+        return cond
+
+    def Let(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        bindings = args[0].value
+        values = [self.Compile(arg.value[1], scope) for arg in bindings]
+        inner = Scope([arg.value[0].value for arg in bindings], scope)
+        body = self.Body(args[1:], inner, tail)
+        extra = [None] * (len(inner.names) - len(values))
+
+        def let(frame: Frame) -> Atom:
+            local = [frame, frame[CTX], *[value(frame) for value in values]]
+            return body(local + extra if extra else local)
+
+        return let
+
+    def Do(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        variables = args[0].value
+        inner = Scope([arg.value[0].value for arg in variables], scope)
+
+        inits = [self.Compile(arg.value[1], scope) for arg in variables]
+        steps = [
+            (slot + SLOTS, self.Compile(arg.value[2], inner))
+            for slot, arg in reversed(list(enumerate(variables)))
+            if len(arg.value) > 2
+        ]
+
+        end = args[1].value
+        test = self.Compile(end[0], inner)
+        result = self.Body(end[1:], inner, tail)
+        body = self.Body(args[2:], inner)
+        extra = [None] * (len(inner.names) - len(inits))
+
+        def do(frame: Frame) -> Atom:
+            local = [frame, frame[CTX], *[init(frame) for init in inits], *extra]
+
+            while test(local) == NIL:
+                body(local)
+                for slot, step in steps:
+                    local[slot] = step(local)
+
+            return result(local)
+
+        return do
+
+    def Dotimes(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        spec = args[0].value
+        inner = Scope([spec[0].value], scope)
+
+        count = self.Compile(spec[1], scope)
+        final = self.Compile(spec[2], inner, tail) if len(spec) > 2 else None
+        body = self.Body(args[1:], inner)
+        size = len(inner.names)
+
+        def dotimes(frame: Frame) -> Atom:
+            local = [frame, frame[CTX], *[None] * size]
+
+            result = NIL
+            for i in range(count(frame).value):
+                local[SLOTS] = integer(i)
+                result = body(local)
+
+            if final is not None:
+                result = final(local)
+
+            return result
+
+        return dotimes
+
+    def Dolist(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        spec = args[0].value
+        inner = Scope([spec[0].value], scope)
+
+        sequence = self.Compile(spec[1], scope)
+        final = self.Compile(spec[2], inner, tail) if len(spec) > 2 else None
+        body = self.Body(args[1:], inner)
+        size = len(inner.names)
+
+        def dolist(frame: Frame) -> Atom:
+            local = [frame, frame[CTX], *[None] * size]
+
+            result = NIL
+            for atom in iterate_over_atom(frame[CTX], sequence(frame)):
+                local[SLOTS] = atom
+                result = body(local)
+
+            if final is not None:
+                result = final(local)
+
+            return result
+
+        return dolist
+
+    def Loop(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        body = self.Compile(args[0], scope)
+        count = self.Compile(args[1], scope)
+
+        def loop(frame: Frame) -> Atom:
+            result = NIL
+            for _ in range(count(frame).value):
+                result = body(frame)
+            return result
+
+        return loop
+
+    def Defvar(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        if args[0].type is not SYMBOL:
+            raise Exception("Variable not a symbol")
+
+        name = args[0].value
+        value = self.Compile(args[1], scope) if len(args) > 1 else None
+
+        def defvar(frame: Frame) -> Atom:
+            result = value(frame) if value is not None else NIL
+            frame[CTX].set_on_parent(name, result)
+            return result
+
+        return defvar
+
+    def WithOutputToString(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        return self.Compile(with_output_to_string_form(args), scope, tail)
+
+    def WithOpenFile(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        spec = args[0].value
+        inner = Scope([spec[0].value], scope)
+
+        arguments = [self.Compile(arg, scope) for arg in spec[1:]]
+        body = self.Body(args[1:], inner)
+        size = len(inner.names)
+
+        def with_open_file(frame: Frame) -> Atom:
+            stream = open_file(frame[CTX], *[argument(frame) for argument in arguments])
+            local = [frame, frame[CTX], stream, *[None] * (size - 1)]
+            try:
+                return body(local)
+            finally:
+                stream.value.close()
+
+        return with_open_file
+
+    def Setf(self, args: list[Atom], scope: Scope, tail: bool = False) -> Compiled:
+        if isinstance(args[0], Expression):
+            function = setter(args[0])
+            place = [self.Compile(arg, scope) for arg in args[0].value[1:]]
+            value = self.Compile(args[1], scope)
+
+            def setf(frame: Frame) -> Atom:
+                return function(frame[CTX], *[p(frame) for p in place], value(frame))
+
+            return setf
+
+        store = self.Store(args[0].value, scope)
+        value = self.Compile(args[1], scope)
+
+        def setf(frame: Frame) -> Atom:
+            result = value(frame)
+            store(frame, result)
+            return result
+
+        return setf
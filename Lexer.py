@@ -1,8 +1,9 @@
 from __future__ import annotations
-from multiprocessing.dummy import Array
-from typing import Any
+from typing import IO, Any, Iterable, Iterator, Union
 from enum import Enum
 import string
+from functools import partial
+import re
 from Reader import Reader
 from cprint import *
 
@@ -18,6 +19,12 @@ class TokenType(Enum):
     SEMICOLON = 7
     LIST = 8
     ARRAY = 9
+    # never lexed, only made by make-hash-table
+    HASH_TABLE = 10
+    # never lexed, a string output stream or an open file
+    STREAM = 11
+    # never lexed, a lazy sequence like file-lines
+    SEQUENCE = 12
 
     def is_atom(self):
         return self != self.CLOSING_BRACKET and self != self.OPEN_BRACKET
@@ -33,6 +40,8 @@ class TokenType(Enum):
 
 
 class Token:
+    __slots__ = ("type", "value")
+
     def __init__(self, type: TokenType, value: Any = None) -> None:
         self.type = type
         self.value = value
@@ -44,11 +53,180 @@ class Token:
         return f"{c('<', FAIL)}{c(self.type, OKBLUE)} {c('value=', FAIL)}[{c(self.value, OKGREEN)}]{c('>', FAIL)}"
 
 
+# enum attribute lookups are slow, hot paths compare against these with `is`
+INTEGER = TokenType.INTEGER
+FLOAT = TokenType.FLOAT
+STRING = TokenType.STRING
+SYMBOL = TokenType.SYMBOL
+SPECIAL = TokenType.SPECIAL
+LIST = TokenType.LIST
+ARRAY = TokenType.ARRAY
+HASH_TABLE = TokenType.HASH_TABLE
+STREAM = TokenType.STREAM
+SEQUENCE = TokenType.SEQUENCE
+OPEN_BRACKET = TokenType.OPEN_BRACKET
+CLOSING_BRACKET = TokenType.CLOSING_BRACKET
+
+
 class Lexer:
     def __init__(self) -> None:
         self.tokens = []
 
+    symbol_chars = string.ascii_letters + "+-=/><*0123456789%?"
+
+    symbol_class = "[" + re.escape(symbol_chars) + "]"
+
+    # one alternative per token kind, each preceded by the whitespace that is
+    # skipped before it; findall hands back the token texts which are then
+    # classified by their first character
+    master = re.compile(
+        r"[ \n\t\r]*("
+        + "|".join(
+            [
+                r"#\(|'\(",
+                rf"'[\s\S]{symbol_class}*",
+                r"(?:-[0-9]|[0-9.])[0-9.]*",
+                r'"[^"]*"',
+                rf"{symbol_class}+",
+                r";[^\n]*",
+                r"[^ \n\t\r]",
+            ]
+        )
+        + ")"
+    )
+
+    symbol_start = frozenset(string.ascii_letters + "+=/><*%?")
+
     def Read(self, code: str) -> Lexer:
+        append = self.tokens.append
+        symbol_start = self.symbol_start
+        matches = iter(self.master.findall(code))
+
+        for text in matches:
+            first = text[0]
+
+            if first == "(":
+                append(Token(OPEN_BRACKET))
+            elif first == ")":
+                append(Token(CLOSING_BRACKET))
+            elif first in symbol_start:
+                append(Token(SYMBOL, text))
+            elif (token := self.Make(text, matches)) is not None:
+                append(token)
+
+        return self
+
+    # strings, comments, brackets and whitespace: everything Stream needs to
+    # find where a complete top-level form ends. Strings and comments are
+    # matched even when unterminated so a chunk boundary inside one is seen.
+    boundaries = re.compile(r'"[^"]*"?|;[^\n]*\n?|[()]|[ \n\t\r]+')
+
+    def Stream(
+        self, source: Union[IO[str], Iterable[str]], size: int = 1 << 16
+    ) -> Iterator[Token]:
+        if hasattr(source, "read"):
+            source = iter(partial(source.read, size), "")
+
+        buffer = ""
+        scan = 0
+        depth = 0
+
+        for chunk in source:
+            buffer += chunk
+            cut = 0
+
+            for m in self.boundaries.finditer(buffer, scan):
+                text = m.group()
+                first = text[0]
+
+                if first == '"':
+                    if len(text) == 1 or text[-1] != '"':
+                        break
+                elif first == ";":
+                    if text[-1] != "\n":
+                        break
+                elif first == "(":
+                    depth += 1
+                elif first == ")":
+                    depth -= 1
+                    if depth <= 0:
+                        depth = 0
+                        cut = m.end()
+                elif depth == 0:
+                    cut = m.end()
+
+                scan = m.end()
+            else:
+                scan = len(buffer)
+
+            if cut:
+                self.tokens = []
+                yield from self.Read(buffer[:cut]).tokens
+                buffer = buffer[cut:]
+                scan -= cut
+
+        self.tokens = []
+        yield from self.Read(buffer).tokens
+
+    def Make(self, text: str, matches: Iterator[str]) -> Token:
+        first = text[0]
+
+        if first in "0123456789." or (first == "-" and text[1:2].isdigit()):
+            if "." in text:
+                return Token(TokenType.FLOAT, float(text))
+            return Token(TokenType.INTEGER, int(text))
+
+        if first in self.symbol_chars:
+            return Token(SYMBOL, text)
+
+        if first == "(":
+            return Token(OPEN_BRACKET)
+
+        if first == ";":
+            return None
+
+        if first == '"' and len(text) > 1:
+            return Token(TokenType.STRING, text[1:-1])
+
+        if text == "'(":
+            return Token(TokenType.LIST, self.Quoted(matches))
+
+        if text == "#(":
+            return Token(TokenType.ARRAY, self.Quoted(matches))
+
+        if first == "'" and len(text) > 1:
+            return Token(TokenType.SPECIAL, text[1:].upper())
+
+        raise Exception(f"READ error during LOAD: {text}")
+
+    def Quoted(self, matches: Iterator[str]) -> list[Token]:
+        # nested forms are collected on an explicit stack during the same
+        # pass, so quoted data is scanned exactly once at any depth
+        elements = []
+        stack = []
+
+        for text in matches:
+            if text == ")":
+                if not stack:
+                    return elements
+
+                kind, parent = stack.pop()
+                parent.append(Token(kind, elements))
+                elements = parent
+            elif text == "(" or text == "'(":
+                stack.append((TokenType.LIST, elements))
+                elements = []
+            elif text == "#(":
+                stack.append((TokenType.ARRAY, elements))
+                elements = []
+            elif (token := self.Make(text, matches)) is not None:
+                elements.append(token)
+
+        raise Exception("READ error during LOAD: unexpected end of input")
+
+    def ReadChars(self, code: str) -> Lexer:
+        # reference character-at-a-time implementation, kept for validation
+        # and benchmarking against Read
         reader = Reader(code)
         while reader.Peek():
             while (read := reader.Peek()) and read in " \n":
@@ -113,8 +291,6 @@ class Lexer:
         self.tokens.append(Token(type=self.bracket_map[reader.Next()]))
         return True
 
-    symbol_chars = string.ascii_letters + "+-=/><*0123456789%?"
-
     def Symbol(self, reader: Reader) -> bool:
         if not (reader.Peek() in self.symbol_chars):
             return False
@@ -127,96 +303,54 @@ class Lexer:
         return True
 
     def Array(self, reader: Reader) -> bool:
-        if reader.Peek() != "#":
-            return False
-
-        if reader.Peek(2) != "(":
+        if reader.Peek() != "#" or reader.Peek(2) != "(":
             return False
 
-        lst = ""
-        reader.Next(2)
-        symbols = []
-        i = 0
-        while (read := reader.Peek()) and read != ")":
-            if read == "(":
-                depth = 0
-                sym = ""
-                while True:
-                    n = reader.Next()
-                    sym += n
-                    if n == "(":
-                        depth += 1
-                    elif n == ")":
-                        depth -= 1
-
-                        if depth == 0:
-                            break
-
-                lst += f'"{sym}"'
-                symbols.append(i)
-                i += 1
-            else:
-                n = reader.Next()
-                lst += n
-                if n == " ":
-                    i += 1
-
-        l = Lexer()
-
-        list_elements = [
-            Token(type=TokenType.SPECIAL, value=v.value) if i in symbols else v
-            for i, v in enumerate(l.Read(lst).tokens)
-        ]
-
-        reader.Next()
-        self.tokens.append(Token(TokenType.ARRAY, list_elements))
-
-        return True
+        return self.Sequence(reader, TokenType.ARRAY)
 
     def List(self, reader: Reader) -> bool:
-        if reader.Peek() != "'":
+        if reader.Peek() != "'" or reader.Peek(2) != "(":
             return False
 
-        if reader.Peek(2) != "(":
-            return False
+        return self.Sequence(reader, TokenType.LIST)
 
-        lst = ""
+    def Sequence(self, reader: Reader, type: TokenType) -> bool:
         reader.Next(2)
-        symbols = []
-        i = 0
-        while (read := reader.Peek()) and read != ")":
-            if read == "(":
-                depth = 0
-                sym = ""
-                while True:
-                    n = reader.Next()
-                    sym += n
-                    if n == "(":
-                        depth += 1
-                    elif n == ")":
-                        depth -= 1
-
-                        if depth == 0:
-                            break
-
-                lst += f'"{sym}"'
-                symbols.append(i)
-                i += 1
-            else:
-                n = reader.Next()
-                lst += n
-                if n == " ":
-                    i += 1
 
-        l = Lexer()
+        # elements are lexed in place into self.tokens, which is swapped for
+        # the innermost open sequence while nested forms are on the stack
+        outer = self.tokens
+        self.tokens = []
+        stack = []
+
+        while True:
+            read = reader.Peek()
+            if read is None:
+                raise Exception("READ error during LOAD: unexpected end of input")
 
-        list_elements = [
-            Token(type=TokenType.SPECIAL, value=v.value) if i in symbols else v
-            for i, v in enumerate(l.Read(lst).tokens)
-        ]
+            if read in " \n":
+                reader.Next()
+            elif read == ")":
+                reader.Next()
+                if not stack:
+                    break
+
+                kind, parent = stack.pop()
+                parent.append(Token(kind, self.tokens))
+                self.tokens = parent
+            elif read == "(" or (read in "'#" and reader.Peek(2) == "("):
+                reader.Next(1 if read == "(" else 2)
+                kind = TokenType.ARRAY if read == "#" else TokenType.LIST
+                stack.append((kind, self.tokens))
+                self.tokens = []
+            else:
+                self.Special(reader) or self.Number(reader) or self.String(
+                    reader
+                ) or self.Symbol(reader) or self.Comment(reader) or self.Error(reader)
 
-        reader.Next()
-        self.tokens.append(Token(TokenType.LIST, list_elements))
+        elements = self.tokens
+        self.tokens = outer
+        self.tokens.append(Token(type, elements))
 
         return True
 
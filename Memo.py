@@ -0,0 +1,98 @@
+from __future__ import annotations
+from collections import OrderedDict
+from functools import update_wrapper
+from typing import Any, Callable, Hashable, Optional
+from Lexer import INTEGER
+from Parser import Atom, Expression, Function
+
+
+DEFAULT_SIZE = 1024
+
+
+class Memo:
+    # an LRU cache of results keyed by argument values. max_size None keeps
+    # every result; arguments that cannot be hashed are never cached
+    def __init__(self, name: str, max_size: Optional[int] = DEFAULT_SIZE) -> None:
+        self.name = name
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncached = 0
+
+    def Wrap(self, func: Callable, key: Callable[[tuple], Hashable] = tuple) -> Callable:
+        entries = self.entries
+
+        def memoized(*args) -> Any:
+            k = key(args)
+            try:
+                result = entries[k]
+            except KeyError:
+                pass
+            except TypeError:
+                self.uncached += 1
+                return func(*args)
+            else:
+                self.hits += 1
+                entries.move_to_end(k)
+                return result
+
+            self.misses += 1
+            result = func(*args)
+            entries[k] = result
+            if self.max_size is not None and len(entries) > self.max_size:
+                entries.popitem(last=False)
+                self.evictions += 1
+
+            return result
+
+        update_wrapper(memoized, func)
+        memoized.memo = self
+        return memoized
+
+    def Clear(self):
+        self.entries.clear()
+
+    def Stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "uncached": self.uncached,
+            "size": len(self.entries),
+            "max-size": self.max_size,
+        }
+
+    def Report(self) -> str:
+        return f"{self.name}: " + " ".join(f"{k}={v}" for k, v in self.Stats().items())
+
+
+class Memoized(Function):
+    # a lisp function whose results are cached by its memo
+    __slots__ = ("memo",)
+
+    def __init__(self, value: Callable, memo: Memo, form: Expression = None) -> None:
+        super().__init__(value, form)
+        self.memo = memo
+
+
+def argument_key(args: tuple) -> tuple:
+    # lisp functions are called as (ctx, *atoms); atoms are compared by type
+    # and value, so lists and arrays (unhashable values) are not cached
+    return tuple([(a.type, a.value) for a in args[1:]])
+
+
+def memoize(function: Atom, name: str, max_size: Optional[int] = DEFAULT_SIZE) -> Memoized:
+    memo = Memo(name, max_size)
+    return Memoized(memo.Wrap(function.value, argument_key), memo, function.form)
+
+
+def memo_spec(spec: Atom) -> tuple[str, Optional[int]]:
+    # defun-memo takes either a name or (name max-size), where a max-size
+    # that is not an integer, like nil, never evicts
+    if isinstance(spec, Expression):
+        size = spec.value[1]
+        return spec.value[0].value, size.value if size.type is INTEGER else None
+
+    return spec.value, DEFAULT_SIZE
@@ -0,0 +1,113 @@
+from __future__ import annotations
+import atexit
+import sys
+from abc import ABC, abstractmethod
+from typing import IO, Callable, Union
+
+
+# print, format t, write-string and the repl write through the sink of their
+# context instead of calling sys.stdout once per form. A sink keeps what is
+# written until size characters are waiting, finish-output is called or the
+# run ends, and then hands it on in one piece. A size of 0 hands every write
+# on straight away
+
+BUFFER_SIZE = 64 * 1024
+
+
+class Sink(ABC):
+    def __init__(self, size: int = BUFFER_SIZE) -> None:
+        self.size = size
+        self.parts = []
+        self.pending = 0
+
+    def Write(self, text: str):
+        self.parts.append(text)
+        self.pending += len(text)
+        if self.pending >= self.size:
+            self.Drain()
+
+    def Drain(self):
+        # swapped rather than cleared, so a write from another thread lands
+        # in the next piece instead of being lost
+        if self.parts:
+            parts, self.parts = self.parts, []
+            self.pending = 0
+            self.Emit("".join(parts))
+
+    def Flush(self):
+        self.Drain()
+
+    def Close(self):
+        self.Flush()
+
+    @abstractmethod
+    def Emit(self, text: str):
+        pass
+
+
+class StdoutSink(Sink):
+    # writes to whatever sys.stdout is when it drains, so redirect_stdout
+    # still works around a run. A terminal gets every write as it happens
+    def __init__(self, size: int = None) -> None:
+        if size is None:
+            size = 0 if sys.stdout is not None and sys.stdout.isatty() else BUFFER_SIZE
+        super().__init__(size)
+
+    def Emit(self, text: str):
+        sys.stdout.write(text)
+
+    def Flush(self):
+        self.Drain()
+        sys.stdout.flush()
+
+
+class CaptureSink(Sink):
+    # keeps everything in memory, for tests, servers and worker processes
+    def __init__(self) -> None:
+        super().__init__(0)
+
+    def Write(self, text: str):
+        self.parts.append(text)
+
+    def Emit(self, text: str):
+        self.parts.append(text)
+
+    def Flush(self):
+        pass
+
+    def Value(self) -> str:
+        return "".join(self.parts)
+
+
+class FileSink(Sink):
+    # a path is opened, and closed again by Close; an open file is left open
+    def __init__(self, file: Union[str, IO[str]], size: int = BUFFER_SIZE, mode: str = "w") -> None:
+        super().__init__(size)
+        self.owned = isinstance(file, str)
+        self.file = open(file, mode, encoding="utf-8") if self.owned else file
+
+    def Emit(self, text: str):
+        self.file.write(text)
+
+    def Flush(self):
+        self.Drain()
+        self.file.flush()
+
+    def Close(self):
+        self.Flush()
+        if self.owned:
+            self.file.close()
+
+
+class CallbackSink(Sink):
+    def __init__(self, callback: Callable[[str], object], size: int = 0) -> None:
+        super().__init__(size)
+        self.callback = callback
+
+    def Emit(self, text: str):
+        self.callback(text)
+
+
+# the sink of every context that was not given one
+STDOUT = StdoutSink()
+atexit.register(STDOUT.Flush)
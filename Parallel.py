@@ -0,0 +1,180 @@
+from __future__ import annotations
+import atexit
+import hashlib
+import marshal
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Optional
+from Cache import decode, encode
+from Output import CaptureSink
+from Parser import Atom, Context, Expression, Function
+from std import STD_LIB, build_list, iterate_over_atom
+
+
+# closures over a Context cannot be pickled, so a function is shipped to the
+# workers as the (lambda ...) form it was defined from, together with the
+# global definitions and values it may refer to. The payload is written once
+# to a file named by its hash and only the path goes with each chunk, so a
+# worker reads it once, compiles it and reuses it for every later chunk and
+# call. Free variables bound by an enclosing let or defun are not shipped
+# and must be globals or parameters.
+
+POOLS: dict[int, ProcessPoolExecutor] = {}
+
+# in the caller: the directory holding the payload files
+PAYLOADS: list[str] = []
+
+# per worker process: payload key -> (ctx, function)
+PREPARED: dict[str, tuple[Context, Any]] = {}
+
+
+def pool(workers: int) -> ProcessPoolExecutor:
+    if (executor := POOLS.get(workers)) is None:
+        executor = POOLS[workers] = ProcessPoolExecutor(max_workers=workers)
+
+    return executor
+
+
+def shutdown():
+    for executor in POOLS.values():
+        executor.shutdown()
+    POOLS.clear()
+
+    for directory in PAYLOADS:
+        shutil.rmtree(directory, ignore_errors=True)
+    PAYLOADS.clear()
+
+
+def store(key: str, payload: bytes) -> str:
+    if not PAYLOADS:
+        PAYLOADS.append(tempfile.mkdtemp(prefix="lisp-pmap-"))
+        atexit.register(shutil.rmtree, PAYLOADS[0], True)
+
+    path = os.path.join(PAYLOADS[0], key)
+    if not os.path.exists(path):
+        # written under another name first, so no worker reads half a file
+        with open(path + ".tmp", "wb") as f:
+            f.write(payload)
+        os.replace(path + ".tmp", path)
+
+    return path
+
+
+def builtin_name(ctx: Context, function: Any) -> Optional[str]:
+    while ctx is not None:
+        if ctx.builtin:
+            for name, value in ctx.scope.items():
+                if value is function:
+                    return name
+        ctx = ctx.parent
+
+    return None
+
+
+def definitions(ctx: Context) -> list[tuple[str, str, Any]]:
+    # global functions and values, outermost first so inner bindings win
+    contexts = []
+    while ctx is not None and not ctx.builtin:
+        contexts.append(ctx)
+        ctx = ctx.parent
+
+    shipped = []
+    for scope in reversed(contexts):
+        for name, value in scope.scope.items():
+            if isinstance(value, Function):
+                if value.form is not None:
+                    shipped.append(("function", name, encode(value.form)))
+            elif isinstance(value, Atom):
+                try:
+                    data = encode(value)
+                    marshal.dumps(data)
+                except (AttributeError, TypeError, ValueError):
+                    continue
+                shipped.append(("value", name, data))
+
+    return shipped
+
+
+def target(ctx: Context, function: Any) -> tuple[str, Any]:
+    if isinstance(function, Expression):
+        return ("form", encode(function))
+
+    if (name := builtin_name(ctx, function)) is not None:
+        return ("builtin", name)
+
+    if isinstance(function, Function) and function.form is not None:
+        return ("form", encode(function.form))
+
+    raise Exception("Only named builtins and lisp functions can run in parallel")
+
+
+def prepare(path: str) -> tuple[Context, Any]:
+    key = os.path.basename(path)
+    if (prepared := PREPARED.get(key)) is not None:
+        return prepared
+
+    from Compiler import Compiler, root_frame
+
+    with open(path, "rb") as f:
+        shipped, (kind, function) = marshal.load(f)
+    ctx = STD_LIB()
+    compiler = Compiler(ctx)
+    frame = root_frame(ctx)
+
+    def build(form: Any) -> Atom:
+        return compiler.Compile(decode(form))(frame)
+
+    for what, name, data in shipped:
+        ctx.Set(name, build(data) if what == "function" else decode(data))
+
+    function = ctx.Get(function) if kind == "builtin" else build(function)
+    prepared = PREPARED[key] = (ctx, function)
+    return prepared
+
+
+def run_chunk(path: str, items: list[Any]) -> list[tuple[str, Any]]:
+    ctx, function = prepare(path)
+
+    results = []
+    for item in items:
+        # output is captured per item and replayed in order by the caller
+        out = ctx.output = CaptureSink()
+        result = function(ctx, decode(item))
+        if isinstance(result, Function) or not isinstance(result, Atom):
+            raise Exception("Parallel functions must return data, not functions")
+        results.append((out.Value(), encode(result)))
+
+    return results
+
+
+def parallel_map(
+    ctx: Context,
+    function: Any,
+    sequence: Atom,
+    chunk_size: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> Atom:
+    items = [encode(item) for item in iterate_over_atom(ctx, sequence)]
+    if not items:
+        return build_list([])
+
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, -(-len(items) // (workers * 4)))
+
+    payload = marshal.dumps((definitions(ctx), target(ctx, function)))
+    path = store(hashlib.sha1(payload).hexdigest(), payload)
+
+    chunks = [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+    futures = [pool(workers).submit(run_chunk, path, chunk) for chunk in chunks]
+
+    results = []
+    sink = ctx.Output()
+    for future in futures:
+        for output, data in future.result():
+            if output:
+                sink.Write(output)
+            results.append(decode(data))
+
+    return build_list(results)
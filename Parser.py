@@ -1,23 +1,81 @@
 from __future__ import annotations
-from ast import Expression
-from pyclbr import Function
-from typing import Union, Any, Iterable
+from typing import IO, Union, Any, Awaitable, Callable, Iterable, Iterator
+import contextvars
+import sys
+import threading
 from cprint import *
 from Reader import Reader
-from Lexer import Lexer, TokenType, Token
+from Lexer import Lexer, TokenType, Token, INTEGER, FLOAT, STRING, SYMBOL, LIST, ARRAY
+from Output import STDOUT, Sink
 
-from prompt_toolkit.shortcuts import prompt
-from pygments.lexers.lisp import CommonLispLexer
-from pygments.styles import get_style_by_name
-from prompt_toolkit.styles import style_from_pygments_cls, merge_styles, Style
-from prompt_toolkit.lexers import PygmentsLexer
-from prompt_toolkit.completion import WordCompleter
 
+# calls and jumps the VM runs between giving way to the event loop
+ASYNC_SLICE = 100
 
-OUTPUT = ""
+# set while Parser.RunAsync drives the run on this task, the only driver that
+# awaits what a coroutine builtin returns
+AWAITING: contextvars.ContextVar[bool] = contextvars.ContextVar("awaiting", default=False)
+
+DEEP_STACK_SIZE = 1024 * 1024 * 1024
+
+# the most c stack a python frame of any backend takes, measured at about 340
+# bytes on the tree walker, with headroom. A limit the stack cannot hold
+# crashes the process instead of raising RecursionError
+DEEP_FRAME_SIZE = 512
+DEEP_RECURSION_LIMIT = DEEP_STACK_SIZE // DEEP_FRAME_SIZE
+
+# the recursion limit is process wide, so it stays raised while any deep run
+# is in progress and every other thread sees it too, on its normal stack.
+# Deep runs are meant for when nothing else in the process recurses deeply
+DEEP_LOCK = threading.Lock()
+deep_runs = 0
+deep_saved_limit = 0
+
+
+def run_deep(func: Callable[[], Any]) -> Any:
+    # runs func on a thread with a very large stack and recursion limit, so
+    # non-tail recursion is bounded by memory rather than the default limits
+    global deep_runs, deep_saved_limit
+    result, error = [], []
+
+    def target():
+        try:
+            result.append(func())
+        except BaseException as e:
+            error.append(e)
+
+    with DEEP_LOCK:
+        if deep_runs == 0:
+            deep_saved_limit = sys.getrecursionlimit()
+            sys.setrecursionlimit(max(deep_saved_limit, DEEP_RECURSION_LIMIT))
+        deep_runs += 1
+
+    try:
+        # the large stack is only given to the thread made here
+        with DEEP_LOCK:
+            stack_size = threading.stack_size(DEEP_STACK_SIZE)
+            try:
+                thread = threading.Thread(target=target)
+                thread.start()
+            finally:
+                threading.stack_size(stack_size)
+        thread.join()
+    finally:
+        # restored by the last deep run to finish, not the first
+        with DEEP_LOCK:
+            deep_runs -= 1
+            if deep_runs == 0:
+                sys.setrecursionlimit(deep_saved_limit)
+
+    if error:
+        raise error[0]
+
+    return result[0]
 
 
 class Atom:
+    __slots__ = ("value", "type")
+
     def __init__(self, value: Any, type: TokenType = None) -> None:
         self.value = value
         self.type = type
@@ -26,7 +84,7 @@ class Atom:
         self,
         ctx: Context,
     ) -> Atom:
-        if self.type == TokenType.SYMBOL:
+        if self.type is SYMBOL:
             return ctx.Get(self.value)
 
         return self
@@ -60,14 +118,14 @@ class Atom:
                 else:
                     v.print("└───", depth + 1, is_child)
 
-    def print(self, depth=-1):
+    def print(self, depth=-1, file=None):
         t = "    " * (depth + 1)
 
-        print(f"{t}{repr(self)}")
+        print(f"{t}{repr(self)}", file=file)
         if isinstance(self.value, list):
 
             for i, v in enumerate(self.value):
-                v.print(depth + 1)
+                v.print(depth + 1, file)
 
     def __repr__(self) -> str:
         value = (
@@ -97,16 +155,64 @@ class Atom:
             print(self)
 
 
+# atoms are never mutated, so small integers and symbols are shared
+SMALL_INTEGERS = range(-128, 1024)
+INTEGERS = tuple(Atom(value=i, type=INTEGER) for i in SMALL_INTEGERS)
+SYMBOLS: dict[str, Atom] = {}
+
+
+def integer(value: int) -> Atom:
+    if -128 <= value < 1024:
+        return INTEGERS[value + 128]
+
+    return Atom(value=value, type=INTEGER)
+
+
+def symbol(name: str) -> Atom:
+    if (atom := SYMBOLS.get(name)) is None:
+        atom = SYMBOLS[name] = Atom(value=name, type=SYMBOL)
+
+    return atom
+
+
+# the atom types of python values returned by builtins and coroutines
+PYTHON_TYPES = {int: INTEGER, float: FLOAT, str: STRING}
+
+
+def make_atom(value: Any, type: TokenType) -> Atom:
+    if type is INTEGER:
+        return integer(value)
+
+    if type is SYMBOL:
+        return symbol(value)
+
+    return Atom(value=value, type=type)
+
+
 class Context:
+    __slots__ = ("scope", "parent", "builtin", "output")
+
     def __init__(
         self,
         scope: dict[str, Atom] = None,
         parent: Context = None,
         builtin: bool = False,
+        output: Sink = None,
     ) -> None:
         self.scope = scope or dict()
         self.parent = parent
         self.builtin = builtin
+        self.output = output
+
+    def Output(self) -> Sink:
+        # the nearest sink up the chain, so every scope of a run shares it
+        ctx = self
+        while ctx.output is None:
+            ctx = ctx.parent
+            if ctx is None:
+                return STDOUT
+
+        return ctx.output
 
     def Get(self, key: str) -> Atom:
         if atom := self.scope.get(key):
@@ -124,6 +230,10 @@ class Context:
 
     def FindAndSet(self, key: str, value: Atom) -> Atom:
         if key in self.scope:
+            if self.builtin:
+                # builtin scopes are shared between contexts, so this one
+                # gets its own copy before it is changed
+                self.scope = dict(self.scope)
             self.scope[key] = value
             return
 
@@ -138,10 +248,40 @@ class Context:
         else:
             self.Set(key, value)
 
-    def func(self, func):
+    def func(self, func: Callable = None, memoize: bool = False, max_size: int = 1024):
+        # usable as @ctx.func or @ctx.func(memoize=True, max_size=...); the
+        # memoized function is returned so python recursion hits the cache too
+        if func is None:
+            return lambda func: self.func(func, memoize, max_size)
+
+        if memoize:
+            from Memo import Memo
+
+            func = Memo(func.__name__, max_size).Wrap(func)
+
         self.scope[func.__name__] = Context.wrap(func)
         return func
 
+    def coroutine(self, func: Callable):
+        # registers an async def function. Calling it from lisp hands the
+        # coroutine to Parser.RunAsync, which awaits it on the event loop and
+        # resumes the script with the result
+        def function(ctx, *args):
+            if not AWAITING.get():
+                raise Exception("Coroutine builtins can only be awaited under Parser.RunAsync")
+            args = [arg.value if not isinstance(arg, Function) else arg for arg in args]
+
+            async def result():
+                value = await func(*args)
+                if value.__class__ is int:
+                    return integer(value)
+                return value if isinstance(value, Atom) else Atom(value, PYTHON_TYPES.get(value.__class__))
+
+            return Pending(result())
+
+        self.scope[func.__name__] = Function(value=function)
+        return func
+
     @staticmethod
     def wrap(func):
         def function(ctx, *args):
@@ -149,9 +289,13 @@ class Context:
                 arg(ctx).value if not isinstance(arg, Function) else arg for arg in args
             ]
 
-            return Atom(func(*args))
+            result = func(*args)
+            if result.__class__ is int:
+                return integer(result)
+
+            return Atom(result, PYTHON_TYPES.get(result.__class__))
 
-        return Function(value=function)
+        return Primitive(value=function, func=func)
 
     @staticmethod
     def Build(functions: dict) -> dict:
@@ -162,12 +306,40 @@ class Context:
         return ctx
 
 
+class Pending:
+    # returned by a coroutine builtin for the async driver to await
+    __slots__ = ("awaitable",)
+
+    def __init__(self, awaitable: Awaitable[Atom]) -> None:
+        self.awaitable = awaitable
+
+
 class Function(Atom):
+    # form is the (lambda ...) expression a lisp function was defined from,
+    # kept so it can be rebuilt elsewhere, like in another process
+    __slots__ = ("form",)
+
+    def __init__(self, value: Callable, form: Expression = None) -> None:
+        super().__init__(value)
+        self.form = form
+
     def __call__(self, ctx: Context, *args) -> Atom:
         return self.value(ctx, *args)
 
 
+class Primitive(Function):
+    # a python function exposed through Context.wrap. func is the unwrapped
+    # callable, so vector builtins can apply it without boxing every element
+    __slots__ = ("func",)
+
+    def __init__(self, value: Callable, func: Callable) -> None:
+        super().__init__(value)
+        self.func = func
+
+
 class Expression(Atom):
+    __slots__ = ()
+
     def __call__(self, ctx: Context) -> Atom:
         from std import reserved
 
@@ -175,9 +347,9 @@ class Expression(Atom):
 
         if isinstance(self.value[0], Expression):
             if isinstance(function, Atom):
-                function = function.value(ctx, *[arg(ctx) for arg in self.value[1:]])
+                return function.value(ctx, *[arg(ctx) for arg in self.value[1:]])
             else:
-                function = function(ctx, *[arg(ctx) for arg in self.value[1:]])
+                return function(ctx, *[arg(ctx) for arg in self.value[1:]])
         else:
             if self.value[0].value in reserved:
                 args = [arg for arg in self.value[1:]]
@@ -195,7 +367,34 @@ class Expression(Atom):
     #     )
 
 
+class Cons(Atom):
+    # a pair in a linked list: value holds the car and cdr the rest, so a
+    # cell is one object and cons, car and cdr never copy
+    __slots__ = ("cdr",)
+
+    def __init__(self, car: Atom, cdr: Atom) -> None:
+        self.value = car
+        self.cdr = cdr
+        self.type = LIST
+
+    def __eq__(self, other: Atom) -> bool:
+        a, b = self, other
+        while a.__class__ is Cons and b.__class__ is Cons:
+            if a is b:
+                return True
+            if a.value != b.value:
+                return False
+            a, b = a.cdr, b.cdr
+
+        if a.__class__ is Cons or b.__class__ is Cons:
+            return False
+
+        return a == b
+
+
 class Symbol(Atom):
+    __slots__ = ()
+
     def __call__(self, _ctx: Context) -> Atom:
         return self
 
@@ -203,6 +402,7 @@ class Symbol(Atom):
 class Parser:
     def __init__(self) -> None:
         self.atoms = []
+        self.compiled = []
 
     def Print(self):
         for atom in self.atoms:
@@ -227,12 +427,49 @@ class Parser:
 
         return self
 
-    def Read(self, code: str) -> Parser:
+    def Read(self, code: str, cache: Cache = None) -> Parser:
+        if cache is not None:
+            return cache.Read(self, code)
+
         lexer = Lexer()
         lexer.Read(code)
         return self.Parse(Reader(stream=lexer.tokens))
 
+    def Stream(self, source: Union[IO[str], Iterable[str]]) -> Iterator[Atom]:
+        form = []
+        depth = 0
+
+        for token in Lexer().Stream(source):
+            form.append(token)
+
+            if token.type == TokenType.OPEN_BRACKET:
+                depth += 1
+            elif token.type == TokenType.CLOSING_BRACKET:
+                depth -= 1
+
+            if depth <= 0:
+                reader = Reader(stream=form)
+                while reader.Peek() is not None:
+                    yield self.__parse__(reader)
+
+                form = []
+                depth = 0
+
+        if form:
+            reader = Reader(stream=form)
+            while reader.Peek() is not None:
+                yield self.__parse__(reader)
+
     def Repl(self, ctx: Context):
+        # only the repl needs these, and they dominate the import time of
+        # everything else, so scripts run without loading them
+        from prompt_toolkit.shortcuts import prompt
+        from pygments.lexers.lisp import CommonLispLexer
+        from pygments.styles import get_style_by_name
+        from prompt_toolkit.styles import style_from_pygments_cls, merge_styles, Style
+        from prompt_toolkit.lexers import PygmentsLexer
+        from prompt_toolkit.completion import WordCompleter
+
         print("Lisper Version 69.0\nGet Coding!\n")
         style = merge_styles(
             [
@@ -258,16 +495,158 @@ class Parser:
                 break
 
             lexer = Lexer()
+            output = ctx.Output()
             try:
                 atom = self.__parse__(Reader(stream=lexer.Read(code).tokens))(ctx)
                 if atom and atom.value:
-                    print(atom.value)
+                    output.Write(f"{atom.value}\n")
             except Exception as e:
+                output.Flush()
                 cprint(e, FAIL)
+            output.Flush()
 
-    def Run(self, ctx: Context) -> Parser:
-        for expression in self.atoms:
-            expression(ctx)
+    def Compile(self, ctx: Context) -> Parser:
+        from Compiler import Compiler
+
+        compiler = Compiler(ctx)
+        self.compiled = [compiler.Compile(atom) for atom in self.atoms]
+        return self
+
+    def Run(
+        self,
+        ctx: Context,
+        backend: str = "tree",
+        deep: bool = False,
+        profile: Profiler = None,
+        budget: Budget = None,
+    ) -> Parser:
+        if deep:
+            return run_deep(lambda: self.Run(ctx, backend, profile=profile, budget=budget))
+
+        if budget is not None:
+            # budgets are charged by the VM, so a budgeted run always uses it;
+            # running out raises Sandbox.BudgetExceeded
+            from Sandbox import metered
+
+            with metered(budget, ctx):
+                return self.Run(ctx, "vm", profile=profile)
+
+        if profile is not None:
+            # compiled code binds builtins when compiled, so it is rebuilt
+            # against the profiled ones and dropped again afterwards
+            profile.Attach(ctx)
+            try:
+                self.compiled = []
+                return self.Run(ctx, backend)
+            finally:
+                self.compiled = []
+                profile.Detach()
+
+        # whatever is still buffered is written out when the run ends, even
+        # if it fails, so output comes before the error. Nothing awaits
+        # coroutine builtins here, even when called from under RunAsync
+        awaiting = AWAITING.set(False)
+        try:
+            if backend == "vm":
+                from VM import Assembler, Machine
+                from Compiler import root_frame
+
+                assembler = Assembler(ctx)
+                machine = Machine()
+                frame = root_frame(ctx)
+                for atom in self.atoms:
+                    machine.Execute(assembler.Assemble(atom), frame)
+            elif backend == "compiled":
+                if len(self.compiled) != len(self.atoms):
+                    self.Compile(ctx)
+
+                from Compiler import root_frame
+
+                frame = root_frame(ctx)
+                for expression in self.compiled:
+                    expression(frame)
+            else:
+                for expression in self.atoms:
+                    expression(ctx)
+        finally:
+            AWAITING.reset(awaiting)
+            ctx.Output().Flush()
+
+        return self
+
+    async def RunAsync(
+        self,
+        ctx: Context,
+        timeout: float = None,
+        slice: int = ASYNC_SLICE,
+        budget: Budget = None,
+    ) -> Parser:
+        # runs on the bytecode VM, giving way to the event loop after every
+        # slice calls and jumps and awaiting coroutine builtins in place.
+        # timeout raises TimeoutError, and cancelling the task stops the run
+        import asyncio
+
+        if timeout is not None:
+            await asyncio.wait_for(self.RunAsync(ctx, slice=slice, budget=budget), timeout)
+            return self
+
+        if budget is not None:
+            from Sandbox import metered
+
+            with metered(budget, ctx):
+                return await self.RunAsync(ctx, slice=budget.slice)
+
+        from VM import Assembler, Machine
+        from Compiler import root_frame
+        from Sandbox import BUDGET
+
+        budget = BUDGET.get()
+
+        assembler = Assembler(ctx)
+        machine = Machine()
+        frame = root_frame(ctx)
+        output = ctx.Output()
+        awaiting = AWAITING.set(True)
+        try:
+            for atom in self.atoms:
+                run = machine.Run(assembler.Assemble(atom), frame, slice)
+                try:
+                    value = None
+                    while True:
+                        try:
+                            request = run.send(value)
+                        except StopIteration:
+                            break
+
+                        if budget is not None:
+                            if request is None:
+                                budget.Charge(slice)
+                            # what other tasks allocate while this one waits is
+                            # not charged to it
+                            budget.Pause()
+                        try:
+                            if request is None:
+                                value = None
+                                await asyncio.sleep(0)
+                            else:
+                                value = await request.awaitable
+                        finally:
+                            if budget is not None:
+                                budget.Resume()
+                finally:
+                    run.close()
+                    output.Flush()
+        finally:
+            AWAITING.reset(awaiting)
+
+        return self
+
+    def RunStream(self, ctx: Context, source: Union[IO[str], Iterable[str]]) -> Parser:
+        try:
+            for expression in self.Stream(source):
+                expression(ctx)
+        finally:
+            ctx.Output().Flush()
 
         return self
 
@@ -289,18 +668,23 @@ class Parser:
         if read.type.is_atom():
             n = reader.Next()
 
-            if read.type == TokenType.LIST:
-                from std import build_list
+            return self.Data(n)
+
+    def Data(self, token: Token) -> Atom:
+        if token.type is LIST:
+            from std import build_list, NIL
 
-                return build_list(n.value)
+            if not token.value:
+                return NIL
 
-            if read.type == TokenType.ARRAY:
-                return Atom(
-                    value=[Atom(value=a.value, type=a.type) for a in read.value],
-                    type=TokenType.ARRAY,
-                )
+            return build_list([self.Data(t) for t in token.value])
 
-            return Atom(value=n.value, type=n.type)
+        if token.type is ARRAY:
+            from std import make_array
+
+            return make_array([self.Data(t) for t in token.value])
+
+        return make_atom(token.value, token.type)
 
     def Expression(self, reader: Reader[Token]) -> Union[Atom, None]:
         read = reader.Peek()
@@ -312,7 +696,10 @@ class Parser:
                 args.append(self.__parse__(reader))
 
             reader.Next()
-            return Expression(args)
+
+            from std import fold
+
+            return fold(args)
 
     def Symbol(self, reader: Reader[Token]) -> Union[Atom, None]:
         read = reader.Peek()
@@ -322,6 +709,3 @@ class Parser:
 
     def Error(self, reader):
         raise Exception("farter: ", reader.Peek())
-
-    def get_out(self):
-        return OUTPUT
@@ -0,0 +1,197 @@
+from __future__ import annotations
+import sys
+import time
+from typing import Any, Callable, Optional
+from Parser import Atom, Context, Function
+
+
+# profiling works by wrapping the functions bound in a context while a
+# profile runs. The backends only look for a wrapped closure on the paths
+# they take for calls that are not to a plain closure, so tail calls keep
+# working and the cost when disabled is next to nothing. Memory is reported as the net change
+# in live python memory blocks across the outermost call of each function,
+# which is cheap enough to take per call. Python keeps no count of gross
+# allocations, and a net figure with the callees' taken out is not one, so
+# there is no exclusive memory column.
+
+
+class Profiled(Function):
+    # the backends time calls to compiled and vm closures themselves, through
+    # profiler and stats, so tail calls stay in their trampolines. enter is
+    # the closure's timed entry point for the compiled trampoline
+    __slots__ = ("name", "function", "profiler", "stats", "enter")
+
+    def __init__(self, value: Callable, name: str, function: Any, profiler: Profiler, stats: Stats) -> None:
+        super().__init__(value, getattr(function, "form", None))
+        self.name = name
+        self.function = function
+        self.profiler = profiler
+        self.stats = stats
+        self.enter = None
+
+        if (enter := getattr(function, "enter", None)) is not None:
+            begin, end = profiler.Enter, profiler.Leave
+
+            def timed(params: list[Atom]) -> Atom:
+                frame = begin(name, stats)
+                try:
+                    return enter(params)
+                finally:
+                    end(frame)
+
+            self.enter = timed
+
+
+class Stats:
+    __slots__ = ("calls", "inclusive", "exclusive", "blocks", "active")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.inclusive = 0.0
+        self.exclusive = 0.0
+        self.blocks = 0
+        self.active = 0
+
+
+class Node:
+    # one node per distinct call stack, for the collapsed-stack output
+    __slots__ = ("children", "time")
+
+    def __init__(self) -> None:
+        self.children = {}
+        self.time = 0.0
+
+
+class ProfiledScope(dict):
+    # a context scope that wraps every function bound while profiling
+    def __init__(self, profiler: Profiler, scope: dict) -> None:
+        super().__init__(scope)
+        self.profiler = profiler
+
+    def __setitem__(self, key: str, value: Any):
+        super().__setitem__(key, self.profiler.Wrap(key, value))
+
+
+class Profiler:
+    def __init__(self) -> None:
+        self.stats: dict[str, Stats] = {}
+        self.root = Node()
+        self.node = self.root
+        self.stack = []
+        self.attached = []
+
+    def Wrap(self, name: str, function: Any) -> Any:
+        if isinstance(function, Profiled) or not callable(function):
+            return function
+        if isinstance(function, Atom) and not isinstance(function, Function):
+            return function
+
+        call = function.value if isinstance(function, Function) else function
+        stats = self.stats.setdefault(name, Stats())
+        enter, leave = self.Enter, self.Leave
+
+        def profiled(ctx: Context, *args) -> Atom:
+            frame = enter(name, stats)
+            try:
+                return call(ctx, *args)
+            finally:
+                leave(frame)
+
+        return Profiled(profiled, name, function, self, stats)
+
+    def Enter(self, name: str, stats: Stats) -> list:
+        parent = self.node
+        if (node := parent.children.get(name)) is None:
+            node = parent.children[name] = Node()
+        self.node = node
+
+        stats.active += 1
+        # stats, parent node, start, blocks and time spent in callees
+        frame = [stats, parent, time.perf_counter(), sys.getallocatedblocks(), 0.0]
+        self.stack.append(frame)
+        return frame
+
+    def Leave(self, frame: list):
+        elapsed = time.perf_counter() - frame[2]
+        blocks = sys.getallocatedblocks() - frame[3]
+        stats, parent = frame[0], frame[1]
+
+        self.stack.pop()
+        stats.calls += 1
+        stats.exclusive += elapsed - frame[4]
+        stats.active -= 1
+        # recursive calls are already inside the outermost call's time
+        if stats.active == 0:
+            stats.inclusive += elapsed
+            stats.blocks += blocks
+
+        self.node.time += elapsed - frame[4]
+        self.node = parent
+
+        if self.stack:
+            self.stack[-1][4] += elapsed
+
+    def Attach(self, ctx: Context) -> Profiler:
+        # wraps the functions of ctx and every context above it, builtins
+        # included; functions defined while attached are wrapped as bound
+        while ctx is not None:
+            original = ctx.scope
+            if ctx.builtin:
+                ctx.scope = {k: self.Wrap(k, v) for k, v in original.items()}
+            else:
+                ctx.scope = ProfiledScope(self, {})
+                for k, v in original.items():
+                    ctx.scope[k] = v
+
+            self.attached.append((ctx, original))
+            ctx = ctx.parent
+
+        return self
+
+    def Detach(self) -> Profiler:
+        for ctx, original in reversed(self.attached):
+            if not ctx.builtin:
+                # keep what was defined while profiling, unwrapped
+                original = {
+                    k: v.function if isinstance(v, Profiled) else v
+                    for k, v in ctx.scope.items()
+                }
+            ctx.scope = original
+
+        self.attached = []
+        return self
+
+    def Report(self, sort: str = "exclusive", limit: Optional[int] = None) -> str:
+        rows = [(name, s) for name, s in self.stats.items() if s.calls]
+        rows.sort(key=lambda row: getattr(row[1], sort), reverse=True)
+
+        lines = [
+            f"{'function':<24} {'calls':>10} {'inclusive ms':>14} {'exclusive ms':>14}"
+            f" {'net blocks':>10}"
+        ]
+        for name, s in rows[:limit]:
+            lines.append(
+                f"{name:<24} {s.calls:>10} {s.inclusive * 1000:>14.3f} "
+                f"{s.exclusive * 1000:>14.3f} {s.blocks:>10}"
+            )
+
+        return "\n".join(lines)
+
+    def Collapsed(self) -> list[str]:
+        # one "outer;inner microseconds" line per stack, as flamegraph.pl reads
+        lines = []
+        pending = [(self.root, ())]
+        while pending:
+            node, path = pending.pop()
+            if path and (micros := round(node.time * 1e6)) > 0:
+                lines.append(f"{';'.join(path)} {micros}")
+            for name, child in node.children.items():
+                pending.append((child, path + (name,)))
+
+        lines.sort()
+        return lines
+
+    def WriteCollapsed(self, filename: str):
+        with open(filename, "w") as f:
+            for line in self.Collapsed():
+                f.write(line + "\n")
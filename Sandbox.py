@@ -0,0 +1,386 @@
+from __future__ import annotations
+import contextlib
+import contextvars
+import io
+import math
+import sys
+import time
+from array import array
+from typing import Any, Callable, Iterator, Optional
+from Lexer import SEQUENCE, STRING
+from Output import Sink
+from Parser import Atom, Cons, Context, Primitive
+
+
+# budgets are charged by the bytecode VM at the points where it already
+# counts calls and jumps for RunAsync, so an unbudgeted run pays nothing.
+# Steps are calls and jumps, charged a slice at a time. Allocations are in
+# bytes: small objects, like atoms and cons cells, are counted from the net
+# change in live python memory blocks, which misses anything larger than a
+# block. A sandbox guards the builtins that make strings, arrays and integers,
+# so they check what they would build against the budget first, and the
+# large values they make are charged until the run drops them. A single
+# builtin call is not interrupted, so integers, which take superlinear time
+# to multiply, are capped outright; only walks of lazy sequences are charged
+# as they go.
+#
+# The block count is process wide. RunAsync pauses a budget while its task
+# waits, so tasks sharing an event loop are only charged for their own
+# slices, but runs on several threads at once see each other's allocations:
+# give allocation limits to one thread's runs at a time
+
+DEFAULT_SLICE = 64
+
+# bytes charged for each small object, as most of what a run allocates takes
+# a block of 48 or 64 bytes; larger objects are allocated outside the blocks
+BLOCK_SIZE = 64
+LARGE = 512
+
+# the largest integer in bytes one call may build under a budget. Multiplying
+# integers takes superlinear time, so a few doublings past this would take
+# seconds no deadline can interrupt
+MAX_INTEGER = 64 * 1024
+
+# bytes of a list cell and the pointer to it while a list is being built
+CELL_SIZE = sys.getsizeof(Cons(None, None)) + 8
+
+# the budget of the run on this thread or task, seen by nested machines
+BUDGET: contextvars.ContextVar[Optional[Budget]] = contextvars.ContextVar(
+    "budget", default=None
+)
+
+# builtins that escape the budget: worker processes, profile files and the
+# file system
+UNSAFE = (
+    "pmap",
+    "pdolist",
+    "profile",
+    "open",
+    "with-open-file",
+    "file-lines",
+    "read-file-bytes",
+    "write-lines",
+)
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, resource: str, limit: Any, used: Any) -> None:
+        super().__init__(f"The {resource} budget of {limit} was exceeded")
+        self.resource = resource
+        self.limit = limit
+        self.used = used
+
+
+class Budget:
+    def __init__(
+        self,
+        steps: Optional[int] = None,
+        allocations: Optional[int] = None,
+        seconds: Optional[float] = None,
+        output: Optional[int] = None,
+        slice: int = DEFAULT_SLICE,
+    ) -> None:
+        self.max_steps = steps
+        self.max_allocations = allocations
+        self.seconds = seconds
+        self.max_output = output
+        self.slice = slice
+        self.Start()
+
+    def Start(self) -> Budget:
+        # a budget is reset by every run it is given to
+        self.steps = 0
+        self.allocated = 0
+        self.output = 0
+        self.started = time.perf_counter()
+        self.blocks = sys.getallocatedblocks()
+        # id to (value, bytes) of the large values builtins made, until dropped
+        self.held = {}
+        self.held_size = 0
+        # missing limits are infinite so Charge needs no branches
+        self.step_limit = math.inf if self.max_steps is None else self.max_steps
+        self.allocation_limit = math.inf if self.max_allocations is None else self.max_allocations
+        self.output_limit = math.inf if self.max_output is None else self.max_output
+        self.deadline = self.started + (math.inf if self.seconds is None else self.seconds)
+        return self
+
+    def Charge(self, steps: int):
+        self.steps += steps
+        if self.steps > self.step_limit:
+            raise BudgetExceeded("step", self.max_steps, self.steps)
+
+        now = time.perf_counter()
+        if now > self.deadline:
+            raise BudgetExceeded("time", self.seconds, now - self.started)
+
+        if self.held:
+            self.Sweep()
+
+        used = (sys.getallocatedblocks() - self.blocks) * BLOCK_SIZE + self.held_size
+        if used > self.allocated:
+            self.allocated = used
+            if used > self.allocation_limit:
+                raise BudgetExceeded("allocation", self.max_allocations, used)
+
+    def Reserve(self, size: int):
+        # checked before a builtin builds size bytes in one call, since they
+        # would be in use before the next charge could see them
+        used = (sys.getallocatedblocks() - self.blocks) * BLOCK_SIZE + self.held_size + size
+        if used > self.allocation_limit and self.held:
+            # values dropped since the last charge are still held
+            self.Sweep()
+            used = (sys.getallocatedblocks() - self.blocks) * BLOCK_SIZE + self.held_size + size
+        if used > self.allocation_limit:
+            raise BudgetExceeded("allocation", self.max_allocations, used)
+
+    def Hold(self, value: Any, size: int):
+        # charges a large value a builtin made, or its new size if it grew
+        if (entry := self.held.pop(id(value), None)) is not None:
+            self.held_size -= entry[1]
+        if size > LARGE:
+            self.held[id(value)] = (value, size)
+            self.held_size += size
+            self.Reserve(0)
+
+    def Sweep(self):
+        # a value referenced only by its entry, and the call looking at it,
+        # has been dropped by the run
+        for key, entry in list(self.held.items()):
+            if sys.getrefcount(entry[0]) == 2:
+                del self.held[key]
+                self.held_size -= entry[1]
+
+    def Pause(self):
+        self.paused = sys.getallocatedblocks()
+
+    def Resume(self):
+        # blocks allocated while paused belong to someone else
+        self.blocks += sys.getallocatedblocks() - self.paused
+
+    def Write(self, size: int):
+        # charged before writing, so output never goes over the limit
+        if self.output + size > self.output_limit:
+            raise BudgetExceeded("output", self.max_output, self.output + size)
+        self.output += size
+
+    def Stats(self) -> dict[str, Any]:
+        return {
+            "steps": self.steps,
+            "allocations": self.allocated,
+            "seconds": round(time.perf_counter() - self.started, 6),
+            "output": self.output,
+        }
+
+    def Report(self) -> str:
+        return "budget " + " ".join(f"{k}={v}" for k, v in self.Stats().items())
+
+
+class MeteredSink(Sink):
+    # wraps the sink of a budgeted run and charges what is written to the
+    # budget of the run doing the writing, before it is buffered
+    def __init__(self, sink: Sink) -> None:
+        self.sink = sink
+
+    def Write(self, text: str):
+        if (budget := BUDGET.get()) is not None:
+            budget.Write(len(text.encode()))
+        self.sink.Write(text)
+
+    def Emit(self, text: str):
+        self.sink.Write(text)
+
+    def Flush(self):
+        self.sink.Flush()
+
+
+@contextlib.contextmanager
+def metered(budget: Budget, ctx: Context) -> Iterator[Budget]:
+    output = ctx.output
+    if not isinstance(ctx.Output(), MeteredSink):
+        ctx.output = MeteredSink(ctx.Output())
+
+    token = BUDGET.set(budget.Start())
+    try:
+        yield budget
+    finally:
+        BUDGET.reset(token)
+        ctx.output = output
+
+
+def integer_size(bits: int) -> int:
+    size = bits // 8
+    if size > MAX_INTEGER:
+        raise BudgetExceeded("integer size", MAX_INTEGER, size)
+    return size if size > LARGE else 0
+
+
+def content_size(value: Any) -> int:
+    # the bytes of a string's or array's items, without the object header
+    return sys.getsizeof(value) - sys.getsizeof(value[:0])
+
+
+def product_size(a: Atom, b: Atom = None, *rest: Atom) -> int:
+    # integers multiply to about the sum of their sizes, and a string or
+    # array times n is n copies of it
+    if b is None:
+        return 0
+    if not rest and a.value.__class__ is int and b.value.__class__ is int:
+        return integer_size(a.value.bit_length() + b.value.bit_length())
+
+    times, bits, sequence = 1, 0, None
+    for value in (a.value, b.value, *[c.value for c in rest]):
+        if value.__class__ is int:
+            times *= value
+            bits += value.bit_length()
+        elif value.__class__ is str or value.__class__ is array:
+            sequence = value
+
+    if sequence is None:
+        return integer_size(bits)
+    return content_size(sequence) * max(times, 0)
+
+
+def sum_size(a: Atom, *rest: Atom) -> int:
+    # numbers only add to numbers, so only strings and arrays are measured
+    if a.value.__class__ is not str and a.value.__class__ is not array:
+        return 0
+    return sum(content_size(v.value) for v in (a, *rest) if v.value.__class__ is a.value.__class__)
+
+
+def concatenate_size(kind: Atom, *sequences: Atom) -> int:
+    # lazy sequences are charged as they are walked
+    if str(kind.value).upper() == "STRING":
+        return sum(content_size(s.value) for s in sequences if s.type is STRING)
+
+    count = 0
+    for sequence in sequences:
+        if sequence.__class__ is Cons:
+            while sequence.__class__ is Cons:
+                count += 1
+                sequence = sequence.cdr
+        elif sequence.type is not SEQUENCE and hasattr(sequence.value, "__len__"):
+            count += len(sequence.value)
+    return count * CELL_SIZE
+
+
+def join_size(strings: Atom, separator: Atom = None) -> int:
+    size, count = 0, 0
+    while strings.__class__ is Cons:
+        if strings.value.type is STRING:
+            size += content_size(strings.value.value)
+        count += 1
+        strings = strings.cdr
+    return size + (0 if separator is None else len(separator.value) * count)
+
+
+def format_size(destination: Atom, control: Atom, *args: Atom) -> int:
+    # what ~a and ~s print of anything but a string is no bigger than it
+    return content_size(control.value) + sum(content_size(a.value) for a in args if a.type is STRING)
+
+
+def factorial_size(n: Any) -> int:
+    return integer_size(int(n * math.log2(n))) if n.__class__ is int and n > 1 else 0
+
+
+def comb_size(n: Any, k: Any = None) -> int:
+    return integer_size(n) if n.__class__ is int else 0
+
+
+def lcm_size(*args: Any) -> int:
+    return integer_size(sum(n.bit_length() for n in args if n.__class__ is int))
+
+
+def perm_size(n: Any, k: Any = None) -> int:
+    if n.__class__ is not int or n < 2:
+        return 0
+    return integer_size(int((n if k is None else k) * math.log2(n)))
+
+
+# builtins that make strings, arrays or integers, and the bytes a call would
+# build where one call can build far more than its arguments
+SIZED = {
+    "*": product_size,
+    "+": sum_size,
+    "concatenate": concatenate_size,
+    "string-join": join_size,
+    "format": format_size,
+    "subseq": None,
+    "vadd": None,
+    "vmul": None,
+    "vmap": None,
+    "vslice": None,
+    "append": None,
+    "get-output-stream-string": None,
+    "write-string": None,
+}
+
+# math functions are given python values rather than atoms
+SIZED_MATH = {
+    "factorial": factorial_size,
+    "comb": comb_size,
+    "perm": perm_size,
+    "lcm": lcm_size,
+}
+
+HELD_TYPES = (str, array, int, list)
+
+# builtins that write to a string output stream, which grows in place
+STREAMED = ("format", "write-string", "get-output-stream-string")
+
+
+def sized(function: Callable, size: Optional[Callable[..., int]], streamed: bool = False) -> Callable:
+    def guarded(ctx: Context, *args: Atom) -> Atom:
+        if (budget := BUDGET.get()) is None:
+            return function(ctx, *args)
+
+        if size is not None and (needed := size(*args)):
+            budget.Reserve(needed)
+        result = function(ctx, *args)
+
+        value = result.value
+        if value.__class__ in HELD_TYPES and (held := sys.getsizeof(value)) > LARGE:
+            budget.Hold(value, held)
+        if streamed:
+            for arg in args:
+                if arg.value.__class__ is io.StringIO:
+                    budget.Hold(arg.value, arg.value.tell())
+        return result
+
+    return guarded
+
+
+def sized_math(primitive: Primitive, size: Callable[..., int]) -> Primitive:
+    func = primitive.func
+
+    def checked(*args: Any) -> Any:
+        if (budget := BUDGET.get()) is not None:
+            budget.Reserve(size(*args))
+        return func(*args)
+
+    return Primitive(value=sized(Context.wrap(checked).value, None), func=checked)
+
+
+def restrict(ctx: Context, names: tuple[str, ...] = UNSAFE) -> Context:
+    # removes builtins from the outermost context, so they are unbound for
+    # every backend, and guards the ones that build strings, arrays and
+    # integers
+    root = ctx
+    while root.parent is not None:
+        root = root.parent
+
+    scope = {k: v for k, v in root.scope.items() if k not in names}
+    for name, size in SIZED.items():
+        if name in scope:
+            scope[name] = sized(scope[name], size, name in STREAMED)
+    for name, size in SIZED_MATH.items():
+        if name in scope:
+            scope[name] = sized_math(scope[name], size)
+
+    root.scope = scope
+    return ctx
+
+
+def sandbox() -> Context:
+    from std import STD_LIB
+
+    return restrict(STD_LIB())
@@ -0,0 +1,700 @@
+from __future__ import annotations
+import sys
+from array import array
+from typing import Any
+from Lexer import SYMBOL
+from Parser import Atom, Context, Expression, Function, Pending, integer
+from Compiler import Bridge, Frame, Scope, CTX, PARENT, SLOTS, frame_get, frame_set
+from std import NIL, arity_error, close, reserved, iterate_over_atom, lambda_form, open_file, setter, with_output_to_string_form
+from Memo import memo_spec, memoize
+from Profiler import Profiled
+from Sandbox import BUDGET, BudgetExceeded
+
+
+# opcodes, each followed by a fixed number of operands in Code.ops
+CONST = 0  # k                push constants[k]
+LOCAL = 1  # slot             push a variable of the current frame
+OUTER = 2  # depth slot       push a variable of an enclosing frame
+GLOBAL = 3  # k               push ctx.Get(constants[k])
+STORE = 4  # depth slot       set a lexical variable to the top of the stack
+STORE_GLOBAL = 5  # k         ctx.FindAndSet(constants[k], top)
+DEFVAR = 6  # k               ctx.set_on_parent(constants[k], top)
+DEFINE = 7  # k               ctx.Set(constants[k], top)
+POP = 8
+JUMP = 9  # target
+JUMP_NIL = 10  # target       pop, jump if NIL
+JUMP_TRUE = 11  # target      pop, jump unless NIL
+CALL = 12  # n                call the function below n arguments
+TAIL_CALL = 13  # n           same, replacing the current call
+BUILTIN = 14  # k n           call the builtin constants[k] with n arguments
+RETURN = 15
+CLOSURE = 16  # k             push a closure over the Code in constants[k]
+ENTER = 17  # n size          pop n values into a new frame of size slots
+LEAVE = 18
+ITER = 19  # slot             replace the top of the stack with an iterator
+RANGE = 20  # slot            replace the top of the stack with a counter
+NEXT = 21  # it var target    store the next item in var or jump when done
+SPECIAL = 22  # k             call a special form without a compiled version
+OPEN = 23  # n                open a file from n arguments and push its stream
+CLOSE = 24  #                 close the stream opened last
+PROFILE_LEAVE = 25  #         end the timing of the profiled call in the frame
+
+OPERANDS = {
+    CONST: 1,
+    LOCAL: 1,
+    OUTER: 2,
+    GLOBAL: 1,
+    STORE: 2,
+    STORE_GLOBAL: 1,
+    DEFVAR: 1,
+    DEFINE: 1,
+    POP: 0,
+    JUMP: 1,
+    JUMP_NIL: 1,
+    JUMP_TRUE: 1,
+    CALL: 1,
+    TAIL_CALL: 1,
+    BUILTIN: 2,
+    RETURN: 0,
+    CLOSURE: 1,
+    ENTER: 2,
+    LEAVE: 0,
+    ITER: 0,
+    RANGE: 0,
+    NEXT: 3,
+    SPECIAL: 1,
+    OPEN: 1,
+    CLOSE: 0,
+    PROFILE_LEAVE: 0,
+}
+
+NAMES = {
+    value: name
+    for name, value in list(globals().items())
+    if isinstance(value, int) and name.isupper()
+}
+
+DONE = object()
+
+
+class Code:
+    def __init__(self, name: str = "toplevel") -> None:
+        self.name = name
+        self.ops = array("l")
+        self.constants = []
+        self.indices = {}
+        self.size = 0
+        self.arity = 0
+        self.form = None
+
+    def Emit(self, op: int, *operands: int) -> int:
+        at = len(self.ops)
+        self.ops.append(op)
+        self.ops.extend(operands)
+        return at
+
+    def Constant(self, value: Any) -> int:
+        if (index := self.indices.get(id(value))) is None:
+            index = self.indices[id(value)] = len(self.constants)
+            self.constants.append(value)
+
+        return index
+
+    def Label(self) -> int:
+        return len(self.ops)
+
+    def Patch(self, at: int, target: int):
+        self.ops[at] = target
+
+    def Disassemble(self) -> str:
+        lines = []
+        pc = 0
+        while pc < len(self.ops):
+            op = self.ops[pc]
+            operands = list(self.ops[pc + 1 : pc + 1 + OPERANDS[op]])
+            lines.append(f"{pc:>5} {NAMES[op]:<12} {' '.join(map(str, operands))}")
+            pc += 1 + OPERANDS[op]
+
+        return "\n".join(lines)
+
+
+class VMClosure(Function):
+    __slots__ = ("code", "env")
+
+    def __init__(self, code: Code, env: Frame) -> None:
+        self.code = code
+        self.env = env
+
+        def function(_ctx, *params) -> Atom:
+            return Machine().Execute(code, self.Frame(params))
+
+        super().__init__(function, code.form)
+
+    def Frame(self, params: tuple[Atom]) -> Frame:
+        size = self.code.size
+        frame = [self.env, self.env[CTX], *params[:size]]
+        if len(frame) < size + SLOTS:
+            if len(params) < self.code.arity:
+                raise arity_error(self.code.arity, len(params))
+            frame.extend([None] * (size + SLOTS - len(frame)))
+
+        return frame
+
+
+# a profiled closure called by the machine returns through this, which ends
+# its timing and returns on to the real caller. Its frame is [profiler, timing]
+PROFILE_RETURN = Code("profile return")
+PROFILE_RETURN.Emit(PROFILE_LEAVE)
+PROFILE_RETURN.Emit(RETURN)
+
+
+class Assembler:
+    def __init__(self, ctx: Context) -> None:
+        self.ctx = ctx
+        self.forms = {
+            "defun": self.Defun,
+            "defun-memo": self.DefunMemo,
+            "lambda": self.Lambda,
+            "progn": self.Progn,
+            "if": self.If,
+            "when": self.When,
+            "cond": self.Cond,
+            "let": self.Let,
+            "do": self.Do,
+            "dotimes": self.Dotimes,
+            "dolist": self.Dolist,
+            "loop": self.Loop,
+            "defvar": self.Defvar,
+            "setf": self.Setf,
+            "with-output-to-string": self.WithOutputToString,
+            "with-open-file": self.WithOpenFile,
+        }
+
+    def Builtin(self, name: str) -> Any:
+        ctx = self.ctx
+        while ctx is not None:
+            if name in ctx.scope:
+                return ctx.scope[name] if ctx.builtin else None
+            ctx = ctx.parent
+
+        return None
+
+    def Assemble(self, atom: Atom) -> Code:
+        code = Code()
+        self.Compile(code, atom, None, False)
+        code.Emit(RETURN)
+        return code
+
+    def Compile(self, code: Code, atom: Atom, scope: Scope, tail: bool):
+        if isinstance(atom, Expression):
+            return self.Expression(code, atom, scope, tail)
+
+        if atom.type is SYMBOL:
+            return self.Load(code, atom.value, scope)
+
+        code.Emit(CONST, code.Constant(atom))
+
+    def Load(self, code: Code, name: str, scope: Scope):
+        if scope is None or (address := scope.Resolve(name)) is None:
+            builtin = self.Builtin(name)
+            if isinstance(builtin, Atom) and not isinstance(builtin, Function):
+                code.Emit(CONST, code.Constant(builtin))
+            else:
+                code.Emit(GLOBAL, code.Constant(name))
+            return
+
+        depth, slot = address
+        if depth == 0:
+            code.Emit(LOCAL, slot)
+        else:
+            code.Emit(OUTER, depth, slot)
+
+    def Store(self, code: Code, name: str, scope: Scope):
+        if scope is None or (address := scope.Resolve(name)) is None:
+            code.Emit(STORE_GLOBAL, code.Constant(name))
+        else:
+            code.Emit(STORE, *address)
+
+    def Body(self, code: Code, body: list[Atom], scope: Scope, tail: bool):
+        if not body:
+            code.Emit(CONST, code.Constant(NIL))
+            return
+
+        for b in body[:-1]:
+            self.Compile(code, b, scope, False)
+            code.Emit(POP)
+
+        self.Compile(code, body[-1], scope, tail)
+
+    def Expression(self, code: Code, expression: Expression, scope: Scope, tail: bool):
+        if not expression.value:
+            code.Emit(CONST, code.Constant(NIL))
+            return
+
+        head, *args = expression.value
+
+        # a form removed from a restricted context is left unbound
+        if head.type is SYMBOL and head.value in reserved and self.Builtin(head.value) is not None:
+            if form := self.forms.get(head.value):
+                return form(code, args, scope, tail)
+
+            special = (reserved[head.value], args, scope)
+            code.Emit(SPECIAL, code.Constant(special))
+            return
+
+        if head.type is SYMBOL and not (scope and scope.Resolve(head.value)):
+            function = self.Builtin(head.value)
+            if isinstance(function, Function):
+                function = function.value
+            if callable(function):
+                for arg in args:
+                    self.Compile(code, arg, scope, False)
+                code.Emit(BUILTIN, code.Constant(function), len(args))
+                return
+
+        self.Compile(code, head, scope, False)
+        for arg in args:
+            self.Compile(code, arg, scope, False)
+        code.Emit(TAIL_CALL if tail else CALL, len(args))
+
+    def Function(self, args: list[Atom], scope: Scope, name: str) -> Code:
+        inner = Scope([param.value for param in args[0].value], scope)
+        function = Code(name)
+        self.Body(function, args[1:], inner, True)
+        function.Emit(RETURN)
+        function.size = len(inner.names)
+        function.arity = len(args[0].value)
+        function.form = lambda_form(args[0], args[1:])
+        return function
+
+    def Defun(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        self.Define(code, args[0].value, args[1:], scope)
+
+    def DefunMemo(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        name, size = memo_spec(args[0])
+        self.Define(code, name, args[1:], scope, lambda _ctx, f: memoize(f, name, size))
+
+    def Define(
+        self, code: Code, name: str, args: list[Atom], scope: Scope, wrap: Any = None
+    ):
+        # a defun inside a body binds its name in the enclosing frame, declared
+        # first so the body can call itself through that slot
+        slot = scope.Declare(name) if scope is not None else None
+
+        function = self.Function(args, scope, name)
+        code.Emit(CLOSURE, code.Constant(function))
+        if wrap is not None:
+            code.Emit(BUILTIN, code.Constant(wrap), 1)
+
+        if slot is None:
+            code.Emit(DEFINE, code.Constant(name))
+        else:
+            code.Emit(STORE, 0, slot)
+
+    def Lambda(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        function = self.Function(args, scope, "lambda")
+        code.Emit(CLOSURE, code.Constant(function))
+
+    def Progn(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        self.Body(code, args, scope, tail)
+
+    def If(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        self.Compile(code, args[0], scope, False)
+        otherwise = code.Emit(JUMP_NIL, 0)
+
+        self.Compile(code, args[1], scope, tail)
+        end = code.Emit(JUMP, 0)
+
+        code.Patch(otherwise + 1, code.Label())
+        if len(args) > 2:
+            self.Compile(code, args[2], scope, tail)
+        else:
+            code.Emit(CONST, code.Constant(NIL))
+
+        code.Patch(end + 1, code.Label())
+
+    def When(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        self.Compile(code, args[0], scope, False)
+        otherwise = code.Emit(JUMP_NIL, 0)
+
+        self.Body(code, args[1:], scope, tail)
+        end = code.Emit(JUMP, 0)
+
+        code.Patch(otherwise + 1, code.Label())
+        code.Emit(CONST, code.Constant(NIL))
+        code.Patch(end + 1, code.Label())
+
+    def Cond(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        ends = []
+        for pair in args:
+            self.Compile(code, pair.value[0], scope, False)
+            following = code.Emit(JUMP_NIL, 0)
+
+            self.Body(code, pair.value[1:], scope, tail)
+            ends.append(code.Emit(JUMP, 0))
+
+            code.Patch(following + 1, code.Label())
+
+        code.Emit(CONST, code.Constant(NIL))
+        for end in ends:
+            code.Patch(end + 1, code.Label())
+
+    def Let(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        bindings = args[0].value
+        for arg in bindings:
+            self.Compile(code, arg.value[1], scope, False)
+
+        inner = Scope([arg.value[0].value for arg in bindings], scope)
+        enter = code.Emit(ENTER, len(bindings), 0)
+        self.Body(code, args[1:], inner, tail)
+        code.Emit(LEAVE)
+
+        # the frame size is only known once nested defuns are declared
+        code.Patch(enter + 2, len(inner.names))
+
+    def Do(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        variables = args[0].value
+        for arg in variables:
+            self.Compile(code, arg.value[1], scope, False)
+
+        inner = Scope([arg.value[0].value for arg in variables], scope)
+        enter = code.Emit(ENTER, len(variables), 0)
+
+        end = args[1].value
+        loop = code.Label()
+        self.Compile(code, end[0], inner, False)
+        done = code.Emit(JUMP_TRUE, 0)
+
+        for b in args[2:]:
+            self.Compile(code, b, inner, False)
+            code.Emit(POP)
+
+        for slot, arg in reversed(list(enumerate(variables))):
+            if len(arg.value) > 2:
+                self.Compile(code, arg.value[2], inner, False)
+                code.Emit(STORE, 0, slot + SLOTS)
+                code.Emit(POP)
+
+        code.Emit(JUMP, loop)
+        code.Patch(done + 1, code.Label())
+
+        self.Body(code, end[1:], inner, tail)
+        code.Emit(LEAVE)
+        code.Patch(enter + 2, len(inner.names))
+
+    def Iterate(
+        self,
+        code: Code,
+        start: int,
+        name: str,
+        spec: list[Atom],
+        body: list[Atom],
+        scope: Scope,
+        tail: bool,
+    ):
+        # the loop variable and the Python iterator driving it share a new
+        # frame; the iterator slot is named so no symbol can refer to it
+        self.Compile(code, spec[1], scope, False)
+        code.Emit(start)
+        code.Emit(CONST, code.Constant(NIL))
+
+        inner = Scope(["#iterator", name], scope)
+        enter = code.Emit(ENTER, 2, 0)
+        code.Emit(CONST, code.Constant(NIL))
+
+        loop = code.Label()
+        step = code.Emit(NEXT, SLOTS, SLOTS + 1, 0)
+        code.Emit(POP)
+        self.Body(code, body, inner, False)
+        code.Emit(JUMP, loop)
+        code.Patch(step + 3, code.Label())
+
+        if len(spec) > 2:
+            code.Emit(POP)
+            self.Compile(code, spec[2], inner, tail)
+
+        code.Emit(LEAVE)
+        code.Patch(enter + 2, len(inner.names))
+
+    def Dotimes(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        spec = args[0].value
+        self.Iterate(code, RANGE, spec[0].value, spec, args[1:], scope, tail)
+
+    def Dolist(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        spec = args[0].value
+        self.Iterate(code, ITER, spec[0].value, spec, args[1:], scope, tail)
+
+    def Loop(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        spec = [None, args[1]]
+        self.Iterate(code, RANGE, "#counter", spec, args[:1], scope, tail)
+
+    def Defvar(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        if args[0].type is not SYMBOL:
+            raise Exception("Variable not a symbol")
+
+        if len(args) > 1:
+            self.Compile(code, args[1], scope, False)
+        else:
+            code.Emit(CONST, code.Constant(NIL))
+
+        code.Emit(DEFVAR, code.Constant(args[0].value))
+
+    def WithOutputToString(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        self.Compile(code, with_output_to_string_form(args), scope, tail)
+
+    def WithOpenFile(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        # the stream is kept in a slot no symbol can name and closed after
+        # the body, whose value is left on the stack. If the body raises,
+        # the machine closes every stream it still has open as it unwinds
+        spec = args[0].value
+        for arg in spec[1:]:
+            self.Compile(code, arg, scope, False)
+        code.Emit(OPEN, len(spec) - 1)
+
+        inner = Scope(["#stream", spec[0].value], scope)
+        enter = code.Emit(ENTER, 1, 0)
+        code.Emit(LOCAL, SLOTS)
+        code.Emit(STORE, 0, SLOTS + 1)
+        code.Emit(POP)
+        self.Body(code, args[1:], inner, False)
+        code.Emit(CLOSE)
+        code.Emit(LEAVE)
+        code.Patch(enter + 2, len(inner.names))
+
+    def Setf(self, code: Code, args: list[Atom], scope: Scope, tail: bool):
+        if isinstance(args[0], Expression):
+            place = args[0].value[1:]
+            for arg in place:
+                self.Compile(code, arg, scope, False)
+            self.Compile(code, args[1], scope, False)
+            code.Emit(BUILTIN, code.Constant(setter(args[0])), len(place) + 1)
+            return
+
+        self.Compile(code, args[1], scope, False)
+        self.Store(code, args[0].value, scope)
+
+
+class Machine:
+    def Execute(self, code: Code, env: Frame) -> Atom:
+        # under a budget every call into the machine is charged, so lisp
+        # called back from python builtins is bounded too
+        if (budget := BUDGET.get()) is None:
+            run = self.Run(code, env)
+        else:
+            budget.Charge(1)
+            run = self.Run(code, env, budget.slice)
+
+        try:
+            request = run.send(None)
+            while request is None:
+                budget.Charge(budget.slice)
+                request = run.send(None)
+        except StopIteration as done:
+            return done.value
+        except BudgetExceeded:
+            run.close()
+            raise
+
+        run.close()
+        request.awaitable.close()
+        raise Exception("Coroutine builtins can only be awaited under Parser.RunAsync")
+
+    def Run(self, code: Code, env: Frame, slice: int = 0):
+        # a generator that returns the value of code. It yields None after
+        # every slice calls and jumps when slice is set, so a driver can give
+        # way to an event loop, and yields the Pending result of a coroutine
+        # builtin to be resumed with the awaited value
+        budget = slice or sys.maxsize
+        ops = code.ops
+        constants = code.constants
+        pc = 0
+        stack = []
+        push = stack.append
+        pop = stack.pop
+
+        # (code, pc, env, base) of every suspended caller; Lisp to Lisp calls
+        # never recurse in Python, so depth is bounded by memory
+        calls = []
+        base = 0
+
+        # files opened by with-open-file and not yet closed, closed here if
+        # the run raises or is abandoned part way through
+        streams = []
+
+        try:
+            while True:
+                op = ops[pc]
+
+                if op == LOCAL:
+                    push(env[ops[pc + 1]])
+                    pc += 2
+                elif op == CONST:
+                    push(constants[ops[pc + 1]])
+                    pc += 2
+                elif op == BUILTIN:
+                    n = ops[pc + 2]
+                    if n:
+                        args = stack[-n:]
+                        del stack[-n:]
+                        value = constants[ops[pc + 1]](env[CTX], *args)
+                    else:
+                        value = constants[ops[pc + 1]](env[CTX])
+                    if value.__class__ is Pending:
+                        value = yield value
+                    push(value)
+                    pc += 3
+                elif op == JUMP_NIL:
+                    if pop() == NIL:
+                        pc = ops[pc + 1]
+                    else:
+                        pc += 2
+                elif op == JUMP:
+                    pc = ops[pc + 1]
+                    budget -= 1
+                    if not budget:
+                        budget = slice
+                        yield None
+                elif op == POP:
+                    pop()
+                    pc += 1
+                elif op == GLOBAL:
+                    push(env[CTX].Get(constants[ops[pc + 1]]))
+                    pc += 2
+                elif op == OUTER:
+                    push(frame_get(env, ops[pc + 1], ops[pc + 2]))
+                    pc += 3
+                elif op == CALL or op == TAIL_CALL:
+                    start = len(stack) - ops[pc + 1]
+                    function = stack[start - 1]
+                    args = stack[start:]
+                    del stack[start - 1 :]
+                    pc += 2
+
+                    budget -= 1
+                    if not budget:
+                        budget = slice
+                        yield None
+
+                    if function.__class__ is VMClosure:
+                        if op == CALL:
+                            calls.append((code, pc, env, base))
+                            base = len(stack)
+                        else:
+                            del stack[base:]
+
+                        code = function.code
+                        ops = code.ops
+                        constants = code.constants
+                        env = function.Frame(args)
+                        pc = 0
+                    elif function.__class__ is Profiled and function.function.__class__ is VMClosure:
+                        # timed until it returns through PROFILE_RETURN, so the
+                        # call stays in the machine and tail calls stay flat
+                        profiler = function.profiler
+                        if op == CALL:
+                            calls.append((code, pc, env, base))
+                            base = len(stack)
+                            calls.append((PROFILE_RETURN, 0, [profiler, profiler.Enter(function.name, function.stats)], base))
+                        else:
+                            del stack[base:]
+                            if calls and calls[-1][0] is PROFILE_RETURN:
+                                # the call it replaces is no longer running
+                                timing = calls[-1][2]
+                                profiler.Leave(timing[1])
+                                timing[1] = profiler.Enter(function.name, function.stats)
+                            else:
+                                calls.append((PROFILE_RETURN, 0, [profiler, profiler.Enter(function.name, function.stats)], base))
+
+                        function = function.function
+                        code = function.code
+                        ops = code.ops
+                        constants = code.constants
+                        env = function.Frame(args)
+                        pc = 0
+                    else:
+                        if isinstance(function, Function):
+                            function = function.value
+                        value = function(env[CTX], *args)
+                        if value.__class__ is Pending:
+                            value = yield value
+                        push(value)
+                elif op == RETURN:
+                    value = pop()
+                    if not calls:
+                        return value
+
+                    del stack[base:]
+                    code, pc, env, base = calls.pop()
+                    ops = code.ops
+                    constants = code.constants
+                    push(value)
+                elif op == NEXT:
+                    item = next(env[ops[pc + 1]], DONE)
+                    if item is DONE:
+                        pc = ops[pc + 3]
+                    else:
+                        env[ops[pc + 2]] = item
+                        pc += 4
+                elif op == JUMP_TRUE:
+                    if pop() != NIL:
+                        pc = ops[pc + 1]
+                    else:
+                        pc += 2
+                elif op == STORE:
+                    frame_set(env, ops[pc + 1], ops[pc + 2], stack[-1])
+                    pc += 3
+                elif op == ENTER:
+                    n = ops[pc + 1]
+                    frame = [env, env[CTX], *stack[len(stack) - n :]]
+                    del stack[len(stack) - n :]
+                    frame.extend([None] * (ops[pc + 2] - n))
+                    env = frame
+                    pc += 3
+                elif op == LEAVE:
+                    env = env[PARENT]
+                    pc += 1
+                elif op == STORE_GLOBAL:
+                    env[CTX].FindAndSet(constants[ops[pc + 1]], stack[-1])
+                    pc += 2
+                elif op == CLOSURE:
+                    push(VMClosure(constants[ops[pc + 1]], env))
+                    pc += 2
+                elif op == DEFINE:
+                    env[CTX].Set(constants[ops[pc + 1]], stack[-1])
+                    pc += 2
+                elif op == DEFVAR:
+                    env[CTX].set_on_parent(constants[ops[pc + 1]], stack[-1])
+                    pc += 2
+                elif op == ITER:
+                    stack[-1] = iter(iterate_over_atom(env[CTX], stack[-1]))
+                    pc += 1
+                elif op == RANGE:
+                    stack[-1] = map(integer, range(stack[-1].value))
+                    pc += 1
+                elif op == SPECIAL:
+                    special, args, scope = constants[ops[pc + 1]]
+                    push(special(Bridge(scope, env) if scope else env[CTX], *args))
+                    pc += 2
+                elif op == OPEN:
+                    n = ops[pc + 1]
+                    args = stack[len(stack) - n :]
+                    del stack[len(stack) - n :]
+                    stream = open_file(env[CTX], *args)
+                    streams.append(stream)
+                    push(stream)
+                    pc += 2
+                elif op == CLOSE:
+                    close(env[CTX], streams.pop())
+                    pc += 1
+                elif op == PROFILE_LEAVE:
+                    env[0].Leave(env[1])
+                    pc += 1
+                else:
+                    raise Exception(f"Unknown opcode {op} at {pc} in {code.name}")
+        finally:
+            for stream in streams:
+                stream.value.close()
+            # profiled calls the run raised out of, innermost first
+            for record in reversed(calls):
+                if record[0] is PROFILE_RETURN:
+                    record[2][0].Leave(record[2][1])
@@ -0,0 +1,52 @@
+from __future__ import annotations
+import sys
+import time
+from Parser import Expression, Parser, integer
+from std import STD_LIB
+from benchmarks.common import best_of
+
+
+OPERATORS = ["+", "-", "*", "/", "//", "%", "rem", "<", ">", "<=", ">=", "="]
+
+
+def per_call(func, calls: int) -> float:
+    return best_of(func, 3) / calls * 1e9
+
+
+def main(calls: int = 100_000) -> None:
+    calls = int(calls)
+    ctx = STD_LIB()
+    ctx.Set("x", integer(7))
+    ctx.Set("y", integer(3))
+    a, b = integer(7), integer(3)
+
+    print(f"{'operator':<10} {'direct':>10} {'tree':>10} {'compiled':>10}  ns per call")
+    for name in OPERATORS:
+        function = ctx.Get(name)
+        args = [(ctx, a, b)] * calls
+
+        def direct():
+            for arguments in args:
+                function(*arguments)
+
+        # variables rather than literals, so nothing is folded at parse time
+        loop = Parser().Read(f"(dotimes (i {calls}) ({name} x y))")
+        empty = Parser().Read(f"(dotimes (i {calls}) y)")
+        tree = per_call(lambda: loop.Run(ctx), calls) - per_call(lambda: empty.Run(ctx), calls)
+        compiled = per_call(lambda: loop.Run(ctx, "compiled"), calls) - per_call(
+            lambda: empty.Run(ctx, "compiled"), calls
+        )
+
+        print(f"{name:<10} {per_call(direct, calls):>10.0f} {tree:>10.0f} {compiled:>10.0f}")
+
+    source = "(+ (* 2 3) (- 10 4) (/ 9 3))"
+    start = time.perf_counter()
+    parser = Parser().Read(source)
+    seconds = time.perf_counter() - start
+    folded = parser.atoms[0]
+    shown = "an expression" if isinstance(folded, Expression) else folded.value
+    print(f"\n{source} parses to {shown} in {seconds * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
@@ -0,0 +1,42 @@
+from __future__ import annotations
+import sys
+from Parser import Parser
+from std import STD_LIB
+from benchmarks.common import best_of, report
+
+
+LOOPS = {
+    "sum": "(defvar total 0) (dotimes (i (length v)) (setf total (+ total (aref v i))))",
+    "dot": "(defvar total 0) (dotimes (i (length v)) (setf total (+ total (* (aref v i) (aref v i)))))",
+}
+
+VECTORIZED = {
+    "sum": "(defvar total (vsum v))",
+    "dot": "(defvar total (vdot v v))",
+}
+
+
+def main(n: int = 100_000) -> None:
+    n = int(n)
+    literal = "(defvar v #(" + " ".join(map(str, range(n))) + "))"
+
+    for name in LOOPS:
+        results = []
+        for label, source, backend in (
+            ("dotimes/aref", LOOPS[name], "tree"),
+            ("dotimes/aref", LOOPS[name], "compiled"),
+            ("vectorized", VECTORIZED[name], "tree"),
+        ):
+            ctx = STD_LIB()
+            Parser().Read(literal).Run(ctx)
+            parser = Parser().Read(source)
+            seconds = best_of(lambda: parser.Run(ctx, backend), 3)
+            results.append(ctx.Get("total").value)
+            report(f"{name} {label} [{backend}]", seconds, f"n={n}")
+
+        # the loop and the vector builtin must agree
+        assert len(set(results)) == 1, results
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
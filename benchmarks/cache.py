@@ -0,0 +1,32 @@
+from __future__ import annotations
+import os
+import sys
+import tempfile
+import time
+from Cache import Cache
+from Parser import Parser
+from benchmarks.lexer import generate
+
+
+def main(megabytes: float = 1.0) -> None:
+    code = generate(int(megabytes * 1024 * 1024))
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "library.lisp")
+        with open(filename, "w") as f:
+            f.write(code)
+
+        cache = Cache(os.path.join(directory, "cache"))
+        for run in ("cold", "warm", "warm"):
+            start = time.perf_counter()
+            cache.ReadFile(Parser(), filename)
+            elapsed = time.perf_counter() - start
+            print(f"{run:<6} {elapsed * 1000:>10.2f} ms  {cache.Report()}")
+
+        start = time.perf_counter()
+        Parser().Read(code)
+        print(f"{'nocache':<6} {(time.perf_counter() - start) * 1000:>9.2f} ms")
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
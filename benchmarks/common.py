@@ -0,0 +1,39 @@
+from __future__ import annotations
+import time
+from typing import Callable
+
+
+FIZZ_BUZZ = """
+(defun fizz-buzz (n)
+    (dotimes (num n)
+        (cond
+            ((and (= (rem num 3) 0) (= (rem num 5) 0))
+                (print "FizzBuzz"))
+            ((= (rem num 3) 0)
+                (print "Fizz"))
+            ((= (rem num 5) 0)
+                (print "Buzz"))
+            (T (print num)))))
+"""
+
+
+def best_of(func: Callable, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def report(name: str, seconds: float, extra: str = "") -> None:
+    print(f"{name:<40} {seconds * 1000:>10.2f} ms  {extra}")
+
+
+FIB = """
+(defun fib (n)
+    (if (< n 2)
+        n
+        (+ (fib (- n 1)) (fib (- n 2)))))
+"""
@@ -0,0 +1,106 @@
+from __future__ import annotations
+import asyncio
+import sys
+import time
+from Parser import Context, Parser
+from std import STD_LIB
+from benchmarks.common import FIB
+
+
+SCRIPT = FIB + """
+(defvar total 0)
+(dotimes (i 3)
+    (setf total (+ total (fib 12)))
+    (setf total (+ total (fetch i))))
+"""
+
+
+def percentiles(name: str, samples: list[float]) -> None:
+    samples = sorted(samples) or [0.0]
+    p = [samples[min(len(samples) - 1, int(q * len(samples)))] * 1000 for q in (0.5, 0.9, 0.99)]
+    print(
+        f"{name:<28} p50 {p[0]:8.2f} ms  p90 {p[1]:8.2f} ms  p99 {p[2]:8.2f} ms"
+        f"  max {samples[-1] * 1000:8.2f} ms  ({len(samples)} samples)"
+    )
+
+
+async def heartbeat(lags: list[float], interval: float = 0.001) -> None:
+    # how late the loop wakes a task that asked to sleep for interval
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+def context(mode: str) -> Context:
+    ctx = STD_LIB()
+
+    if mode == "async":
+
+        @ctx.coroutine
+        async def fetch(i):
+            await asyncio.sleep(0.001)
+            return i
+
+    else:
+
+        @ctx.func
+        def fetch(i):
+            time.sleep(0.001)
+            return i
+
+    return ctx
+
+
+async def concurrent(scripts: int, mode: str) -> None:
+    parser = Parser().Read(SCRIPT)
+    latencies, lags = [], []
+    beat = asyncio.create_task(heartbeat(lags))
+
+    async def one():
+        start = time.perf_counter()
+        if mode == "async":
+            await parser.RunAsync(context(mode))
+        else:
+            parser.Run(context(mode), "vm")
+            await asyncio.sleep(0)
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[one() for _ in range(scripts)])
+    beat.cancel()
+
+    percentiles(f"{mode} script latency", latencies)
+    percentiles(f"{mode} event loop lag", lags)
+
+
+async def cancellation() -> None:
+    forever = Parser().Read("(do ((i 0 (+ i 1))) (nil) i)")
+    start = time.perf_counter()
+    try:
+        await forever.RunAsync(STD_LIB(), timeout=0.05)
+    except TimeoutError:
+        print(f"infinite loop stopped by a 50ms timeout after {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+def outside() -> None:
+    # a coroutine builtin has nothing to await it outside RunAsync
+    parser = Parser().Read(SCRIPT)
+    for backend in ("tree", "compiled", "vm"):
+        try:
+            parser.Run(context("async"), backend)
+        except Exception as e:
+            if "Parser.RunAsync" not in str(e):
+                raise
+        else:
+            raise Exception(f"a coroutine builtin ran outside RunAsync [{backend}]")
+
+
+def main(scripts: int = 200) -> None:
+    outside()
+    for mode in ("blocking", "async"):
+        asyncio.run(concurrent(int(scripts), mode))
+    asyncio.run(cancellation())
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
@@ -0,0 +1,43 @@
+from __future__ import annotations
+import sys
+from Parser import Context, Parser
+from std import STD_BUILTINS, STD_LIB
+from benchmarks.common import best_of, report
+
+
+REQUEST = "(defun square (x) (* x x)) (square 12)"
+
+
+def rebuilt() -> Context:
+    # what STD_LIB used to do on every call
+    return Context(parent=Context(scope=STD_BUILTINS(), builtin=True))
+
+
+def per_call(func, n: int) -> float:
+    return best_of(lambda: [func() for _ in range(n)], 5) / n
+
+
+def main(n: int = 10000) -> None:
+    n = int(n)
+
+    report("build the shared builtins once", best_of(STD_BUILTINS, 5))
+
+    before = per_call(rebuilt, n // 10)
+    after = per_call(STD_LIB, n)
+    report("context, rebuilt builtins", before, f"{before * 1e6:8.2f} us each")
+    report("context, shared builtins", after, f"{after * 1e6:8.2f} us each, {before / after:.0f}x")
+
+    parser = Parser().Read(REQUEST)
+    for backend in ("tree", "vm"):
+        before = per_call(lambda: parser.Run(rebuilt(), backend), n // 10)
+        after = per_call(lambda: parser.Run(STD_LIB(), backend), n)
+        report(f"request, rebuilt builtins [{backend}]", before, f"{before * 1e6:8.2f} us each")
+        report(
+            f"request, shared builtins [{backend}]",
+            after,
+            f"{after * 1e6:8.2f} us each, {before / after:.1f}x",
+        )
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
@@ -0,0 +1,61 @@
+from __future__ import annotations
+import os
+import subprocess
+import sys
+import time
+from Parser import Parser
+from std import STD_LIB
+from benchmarks.common import report
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEPTH = """
+(defun depth (n) (if (= n 0) 0 (+ 1 (depth (- n 1)))))
+(defvar result (depth {n}))
+"""
+
+RUNAWAY = "(defun f (n) (+ 1 (f n))) (print (f 1))"
+
+# run in a child, since a recursion limit the deep stack cannot hold kills
+# the process instead of raising
+CHILD = """
+import time
+from Parser import Parser
+from std import STD_LIB
+
+start = time.perf_counter()
+try:
+    Parser().Read({program!r}).Run(STD_LIB(), {backend!r}, deep=True)
+except RecursionError:
+    print(time.perf_counter() - start)
+"""
+
+
+def runaway(backend: str) -> float:
+    code = CHILD.format(program=RUNAWAY, backend=backend)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0 or not result.stdout:
+        raise Exception(f"runaway recursion exited with {result.returncode} instead of raising [{backend}]")
+
+    return float(result.stdout)
+
+
+def main(n: int = 100_000) -> None:
+    n = int(n)
+
+    # the vm never recurses in python, so only the other two need the stack
+    for backend in ("tree", "compiled"):
+        ctx = STD_LIB()
+        parser = Parser().Read(DEPTH.format(n=n))
+        start = time.perf_counter()
+        parser.Run(ctx, backend, deep=True)
+        report(f"recursion {n} deep [{backend}]", time.perf_counter() - start)
+        if ctx.Get("result").value != n:
+            raise Exception(f"recursion {n} deep returned {ctx.Get('result').value} [{backend}]")
+
+        report(f"runaway recursion raised [{backend}]", runaway(backend))
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
@@ -0,0 +1,75 @@
+from __future__ import annotations
+import contextlib
+import io
+import sys
+from Parser import Parser
+from std import STD_LIB
+from benchmarks.common import FIB, FIZZ_BUZZ, best_of, report
+
+
+PROGRAMS = {
+    "fizz-buzz": FIZZ_BUZZ + "(fizz-buzz 3000)",
+    "fib": FIB + "(fib 18)",
+    "nested-loops": """
+(defun nested (n)
+    (let ((total 0))
+        (dotimes (i n)
+            (let ((a i))
+                (dotimes (j n)
+                    (let ((b j))
+                        (dotimes (k 10)
+                            (setf total (+ total (+ a (+ b k)))))))))
+        total))
+(print (nested 40))
+""",
+}
+
+BACKENDS = ["tree", "compiled", "vm"]
+
+# a call with too few arguments fails the same way on every backend, even
+# when the missing parameter is never read
+SHORT_CALL = "(defun f (a b) a) (f 1)"
+
+
+def run(parser: Parser, backend: str) -> str:
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        parser.compiled = []
+        parser.Run(STD_LIB(), backend=backend)
+
+    return out.getvalue()
+
+
+def check() -> None:
+    errors = set()
+    for backend in BACKENDS:
+        try:
+            Parser().Read(SHORT_CALL).Run(STD_LIB(), backend)
+        except Exception as e:
+            errors.add(str(e))
+        else:
+            raise Exception(f"a call with too few arguments ran [{backend}]")
+
+    if len(errors) != 1:
+        raise Exception(f"backends disagree on a call with too few arguments: {errors}")
+
+
+def main(*names: str) -> None:
+    sys.setrecursionlimit(100_000)
+    check()
+
+    for name in names or PROGRAMS:
+        parser = Parser().Read(PROGRAMS[name])
+        expected = run(parser, "tree")
+
+        for backend in BACKENDS:
+            # every backend must print exactly what the tree walker prints
+            if run(parser, backend) != expected:
+                report(f"{name} [{backend}]", float("nan"), "OUTPUT MISMATCH")
+                continue
+
+            report(f"{name} [{backend}]", best_of(lambda: run(parser, backend), repeat=3))
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -0,0 +1,104 @@
+from __future__ import annotations
+import os
+import sys
+import tempfile
+import tracemalloc
+from Lexer import STRING
+from Parser import Atom, Parser
+from std import STD_LIB, build_list
+from benchmarks.common import best_of, report
+
+
+# a log of n lines of about 60 bytes
+LINE = "2024-01-01T00:00:{second:02d} INFO request {i} served in {ms} ms\n"
+
+FILE_LINES = """
+(defvar count 0)
+(dolist (line (file-lines path)) (setf count (+ count 1)))
+"""
+
+READ_LINE = """
+(defvar count 0)
+(with-open-file (in path)
+    (do ((line (read-line in nil -1) (read-line in nil -1)))
+        ((= line -1))
+        (setf count (+ count 1))))
+"""
+
+# the old way: read in python and handed over as a list of strings
+PRELOADED = """
+(defvar count 0)
+(dolist (line lines) (setf count (+ count 1)))
+"""
+
+COPY = "(write-lines copy (file-lines path))"
+
+BYTES = "(defvar size (length (read-file-bytes path)))"
+
+
+def preload(ctx, path: str):
+    with open(path, encoding="utf-8") as f:
+        ctx.scope["lines"] = build_list([Atom(value=line[:-1], type=STRING) for line in f])
+
+
+def run(source: str, path: str, copy: str, backend: str, preloaded: bool = False) -> tuple[float, int]:
+    ctx = STD_LIB()
+    ctx.scope["path"] = Atom(value=path, type=STRING)
+    ctx.scope["copy"] = Atom(value=copy, type=STRING)
+    parser = Parser().Read(source)
+
+    def go():
+        if preloaded:
+            preload(ctx, path)
+        parser.Run(ctx, backend)
+
+    seconds = best_of(go, 3)
+
+    # peak python memory of one more run, which tracemalloc slows down
+    tracemalloc.start()
+    go()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def check(backend: str) -> None:
+    # nil is neither a path nor a stream, and must not name a file
+    try:
+        Parser().Read('(write-lines nil (list "a"))').Run(STD_LIB(), backend)
+    except Exception as e:
+        if "is not a path or stream" not in str(e):
+            raise
+    else:
+        raise Exception(f"write-lines wrote to nil [{backend}]")
+
+
+def main(n: int = 1_000_000, backend: str = "vm") -> None:
+    n = int(n)
+    check(backend)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "access.log")
+        copy = os.path.join(directory, "copy.log")
+        with open(path, "w") as f:
+            f.writelines(LINE.format(second=i % 60, i=i, ms=i % 997) for i in range(n))
+        size = os.path.getsize(path)
+
+        with open(path) as f:
+            plain = best_of(lambda: sum(1 for _ in f.seek(0) or f), 3)
+        report("python for line in file", plain, f"{n / plain:>12,.0f} lines/s")
+
+        for name, source, preloaded in (
+            ("file-lines dolist", FILE_LINES, False),
+            ("read-line do loop", READ_LINE, False),
+            ("preloaded list", PRELOADED, True),
+            ("write-lines copy", COPY, False),
+            ("read-file-bytes length", BYTES, False),
+        ):
+            seconds, peak = run(source, path, copy, backend, preloaded)
+            # mapping the file reads none of it, so only its peak is of interest
+            rate = f"{n / seconds:>12,.0f} lines/s {size / seconds / 2**20:>8.1f} MB/s" if source is not BYTES else ""
+            report(f"{name} [{backend}]", seconds, f"{rate:<33}  peak {peak / 2**20:.1f} MB")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
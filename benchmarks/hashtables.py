@@ -0,0 +1,91 @@
+from __future__ import annotations
+import sys
+import time
+from Parser import Parser
+from std import NIL, STD_LIB
+from benchmarks.common import report
+
+
+TABLE_BUILD = """
+(defvar table (make-hash-table))
+(dotimes (i {n}) (setf (gethash i table) (* i 2)))
+"""
+
+TABLE_LOOKUP = """
+(defvar total 0)
+(dotimes (i {lookups}) (setf total (+ total (gethash (* i {stride}) table))))
+"""
+
+ALIST_BUILD = """
+(defun alist-get (k al)
+    (if al
+        (if (= (caar al) k) (cdar al) (alist-get k (cdr al)))
+        nil))
+(defvar alist nil)
+(dotimes (i {n}) (setf alist (cons (cons i (* i 2)) alist)))
+"""
+
+ALIST_LOOKUP = """
+(defvar total 0)
+(dotimes (i {lookups}) (setf total (+ total (alist-get (* i {stride}) alist))))
+"""
+
+# a key computed by a builtin must find what a literal key stored
+BUILTIN_KEY = """
+(defvar keys (make-hash-table))
+(setf (gethash 2.0 keys) 'found)
+(defvar found (gethash (sqrt 4.0) keys))
+"""
+
+
+def check(backend: str) -> None:
+    ctx = STD_LIB()
+    Parser().Read(BUILTIN_KEY).Run(ctx, backend)
+    if ctx.Get("found") is NIL:
+        raise Exception(f"(sqrt 4.0) missed the key 2.0 [{backend}]")
+
+    # a key no lookup could hash is an error for remhash too, even when the
+    # table is empty
+    for source in ("(gethash keys keys)", "(remhash keys (make-hash-table))"):
+        try:
+            Parser().Read(source).Run(ctx, backend)
+        except Exception as e:
+            if "cannot be a hash table key" not in str(e):
+                raise
+        else:
+            raise Exception(f"{source} accepted an unhashable key [{backend}]")
+
+
+def timed(source: str, ctx, backend: str) -> float:
+    parser = Parser().Read(source)
+    start = time.perf_counter()
+    parser.Run(ctx, backend)
+    return time.perf_counter() - start
+
+
+def main(n: int = 100_000, alist_lookups: int = 20, backend: str = "vm") -> None:
+    # the alist needs about n / 2 steps per lookup, so only a few lookups
+    # are timed and the rest projected
+    n, alist_lookups = int(n), int(alist_lookups)
+    check(backend)
+
+    for name, build, lookup, lookups in (
+        ("hash table", TABLE_BUILD, TABLE_LOOKUP, n),
+        ("alist", ALIST_BUILD, ALIST_LOOKUP, alist_lookups),
+    ):
+        ctx = STD_LIB()
+        stride = max(1, n // lookups)
+        built = timed(build.format(n=n), ctx, backend)
+        looked = timed(lookup.format(lookups=lookups, stride=stride), ctx, backend)
+
+        per = looked / lookups
+        report(f"{name} build {n} keys [{backend}]", built)
+        report(
+            f"{name} {lookups} lookups [{backend}]",
+            looked,
+            f"{per * 1e6:10.2f} us each, {n} lookups ~ {per * n:.2f} s",
+        )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
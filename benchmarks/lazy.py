@@ -0,0 +1,65 @@
+from __future__ import annotations
+import json
+import os
+import subprocess
+import sys
+from benchmarks.common import report
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EVEN = "(lambda (x) (= (rem x 2) 0))"
+
+SQUARE = "(lambda (x) (* x x))"
+
+LAZY = f"""
+(defvar total 0)
+(dolist (x (lazy-map {SQUARE} (lazy-filter {EVEN} (range {{n}}))))
+    (setf total (+ total x)))
+"""
+
+# the same pipeline with every stage realized as a list before the next
+EAGER = f"""
+(defvar xs (concatenate 'list (range {{n}})))
+(defvar evens (concatenate 'list (lazy-filter {EVEN} xs)))
+(defvar squares (concatenate 'list (lazy-map {SQUARE} evens)))
+(defvar total 0)
+(dolist (x squares) (setf total (+ total x)))
+"""
+
+# each run is a process of its own, so its peak memory is its own
+CHILD = """
+import json, resource, sys, time
+from Parser import Parser
+from std import STD_LIB
+
+sys.setrecursionlimit(100_000)
+ctx = STD_LIB()
+parser = Parser().Read({program!r})
+start = time.perf_counter()
+parser.Run(ctx, {backend!r})
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "total": ctx.Get("total").value,
+    "peak": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}}))
+"""
+
+
+def measure(program: str, backend: str) -> dict:
+    code = CHILD.format(program=program, backend=backend)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def main(n: int = 10**7, backend: str = "compiled") -> None:
+    n = int(float(n))
+    expected = sum(x * x for x in range(0, n, 2))
+
+    for name, program in (("lazy", LAZY), ("eager", EAGER)):
+        result = measure(program.format(n=n), backend)
+        if result["total"] != expected:
+            raise Exception(f"{name} summed to {result['total']}, not {expected}")
+        report(f"{name} filter/map/sum {n} [{backend}]", result["seconds"], f"peak rss {result['peak'] / 2**20:.0f} MB")
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
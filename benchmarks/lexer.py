@@ -0,0 +1,32 @@
+from __future__ import annotations
+import sys
+from Lexer import Lexer
+from benchmarks.common import FIZZ_BUZZ, best_of, report
+
+
+def generate(size: int) -> str:
+    unit = FIZZ_BUZZ + '(format t "~s and ~s~%" \'(1 2.5 "three" four) #(5 6))\n'
+    return unit * (size // len(unit) + 1)
+
+
+def literal(elements: int) -> str:
+    pairs = " ".join(f'({i} "v{i}" #({i} {i}))' for i in range(elements))
+    return f"(defvar table '({pairs}))\n"
+
+
+def main(megabytes: float = 2.0, elements: int = 100_000) -> None:
+    code = generate(int(megabytes * 1024 * 1024))
+    size = len(code) / (1024 * 1024)
+
+    for name, read in (("Lexer.ReadChars", Lexer.ReadChars), ("Lexer.Read", Lexer.Read)):
+        seconds = best_of(lambda: read(Lexer(), code), repeat=3)
+        report(name, seconds, f"{size / seconds:8.2f} MB/s")
+
+    code = literal(int(elements))
+    for name, read in (("Lexer.ReadChars", Lexer.ReadChars), ("Lexer.Read", Lexer.Read)):
+        seconds = best_of(lambda: read(Lexer(), code), repeat=3)
+        report(f"{name} ({int(elements)}-element literal)", seconds)
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
@@ -0,0 +1,40 @@
+from __future__ import annotations
+import sys
+from Lexer import TokenType
+from Parser import Atom, Parser
+from std import STD_LIB, build_list, iterate_over_atom
+from benchmarks.common import best_of, report
+
+
+BUILD = """
+(defvar xs nil)
+(dotimes (i {n}) (setf xs (cons i xs)))
+"""
+
+TRAVERSE = """
+(defvar total 0)
+(dolist (x xs) (setf total (+ total x)))
+"""
+
+
+def main(n: int = 1_000_000) -> None:
+    n = int(n)
+    items = [Atom(value=i, type=TokenType.INTEGER) for i in range(n)]
+    literal = "'(" + " ".join(map(str, range(n))) + ")"
+
+    built = build_list(items)
+    report("build_list", best_of(lambda: build_list(items), 3), f"n={n}")
+    report("iterate", best_of(lambda: sum(1 for _ in iterate_over_atom(None, built)), 3))
+    report("quoted literal", best_of(lambda: Parser().Read(literal), 3))
+
+    for backend in ("compiled", "vm"):
+        ctx = STD_LIB()
+        build = Parser().Read(BUILD.format(n=n))
+        traverse = Parser().Read(TRAVERSE)
+        report(f"cons in dotimes [{backend}]", best_of(lambda: build.Run(ctx, backend), 1))
+        report(f"dolist sum [{backend}]", best_of(lambda: traverse.Run(ctx, backend), 1))
+        report(f"length [{backend}]", best_of(lambda: Parser().Read("(length xs)").Run(ctx, backend), 1))
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
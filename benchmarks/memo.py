@@ -0,0 +1,32 @@
+from __future__ import annotations
+import sys
+from Parser import Parser
+from std import STD_LIB
+from benchmarks.common import FIB, best_of, report
+
+
+FIB_MEMO = FIB.replace("defun", "defun-memo")
+
+
+def main(n: int = 22) -> None:
+    n = int(n)
+    sys.setrecursionlimit(100_000)
+
+    for backend in ("tree", "compiled", "vm"):
+        for label, source in (("defun", FIB), ("defun-memo", FIB_MEMO)):
+            # a fresh definition every run, so the memo starts out empty
+            parser = Parser().Read(source + f"(defvar result (fib {n}))")
+
+            def run():
+                ctx = STD_LIB()
+                parser.Run(ctx, backend)
+                return ctx
+
+            seconds = best_of(run, 3)
+            fib = run().Get("fib")
+            stats = fib.memo.Report() if hasattr(fib, "memo") else ""
+            report(f"fib {n} {label} [{backend}]", seconds, stats)
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
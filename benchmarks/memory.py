@@ -0,0 +1,42 @@
+from __future__ import annotations
+import sys
+import tracemalloc
+from typing import Any, Callable
+from Lexer import Lexer, TokenType
+from Parser import Atom, Context, Parser
+from std import STD_LIB, build_list
+
+
+CHUNK = 100
+
+
+def per_object(name: str, build: Callable[[], Any], count: int) -> None:
+    # bytes still allocated once build returns, divided by the objects it made
+    tracemalloc.start()
+    kept = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    print(f"{name:<20} {current / count:>10.1f} bytes")
+
+
+def main(count: int = 100_000) -> None:
+    count = int(count) // CHUNK * CHUNK
+    ctx = STD_LIB()
+    add = ctx.Get("+")
+    one = Atom(value=1, type=TokenType.INTEGER)
+    items = [Atom(value=i, type=TokenType.INTEGER) for i in range(CHUNK)]
+
+    source = " ".join(f"(setf x{i % 100} (+ x {i % 1000}))" for i in range(count // 5))
+    tokens = len(Lexer().Read(source).tokens)
+    atoms = tokens - 2 * source.count("(")
+
+    per_object("cons cell", lambda: [build_list(items) for _ in range(count // CHUNK)], count)
+    per_object("integer", lambda: [add(ctx, one, items[i % CHUNK]) for i in range(count)], count)
+    per_object("context", lambda: [Context(parent=ctx) for _ in range(count)], count)
+    per_object("token", lambda: Lexer().Read(source).tokens, tokens)
+    per_object("parsed atom", lambda: Parser().Read(source).atoms, atoms)
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
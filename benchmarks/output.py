@@ -0,0 +1,63 @@
+from __future__ import annotations
+import os
+import subprocess
+import sys
+from benchmarks.common import report
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROGRAM = "(dotimes (i {n}) (print i))"
+
+# run in a child whose stdout is a pipe read by this process; it reports the
+# seconds spent running the program on stderr
+CHILD = """
+import sys, time
+from Output import StdoutSink
+from Parser import Parser
+from std import STD_LIB, _str
+
+ctx = STD_LIB()
+mode = {mode!r}
+if mode == "print":
+    # how print wrote before there were sinks
+    ctx.parent.scope = dict(ctx.parent.scope, print=lambda ctx, v: print(_str(ctx, v)))
+elif mode != "sink":
+    ctx.output = StdoutSink(int(mode))
+
+parser = Parser().Read({program!r})
+start = time.perf_counter()
+parser.Run(ctx, "vm")
+print(time.perf_counter() - start, file=sys.stderr)
+"""
+
+
+def piped(n: int, mode: str, unbuffered: bool) -> float:
+    env = dict(os.environ)
+    env.pop("PYTHONUNBUFFERED", None)
+    if unbuffered:
+        env["PYTHONUNBUFFERED"] = "1"
+
+    code = CHILD.format(mode=mode, program=PROGRAM.format(n=n))
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, check=True)
+    lines = result.stdout.count(b"\n")
+    if lines != n:
+        raise Exception(f"{mode} wrote {lines} lines, not {n}")
+
+    return float(result.stderr)
+
+
+def main(n: int = 10**6, repeat: int = 3) -> None:
+    n, repeat = int(n), int(repeat)
+
+    for unbuffered in (True, False):
+        stdout = "unbuffered" if unbuffered else "buffered"
+        plain = None
+        for mode, label in (("print", "print"), ("sink", "sink"), (str(2**20), "1mb sink"), ("0", "size 0 sink")):
+            seconds = min(piped(n, mode, unbuffered) for _ in range(repeat))
+            plain = plain or seconds
+            report(f"{n} lines, {label} [{stdout}]", seconds, f"{n / seconds:>12,.0f} lines/s  x{plain / seconds:.2f}")
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
@@ -0,0 +1,41 @@
+from __future__ import annotations
+import os
+import sys
+import Parallel
+from Parser import Parser
+from std import STD_LIB
+from benchmarks.common import best_of, report
+
+
+WORK = """
+(defun work (n)
+    (let ((s 0))
+        (dotimes (i n) (setf s (+ s (% i 7))))
+        s))
+"""
+
+
+def main(items: int = 64, size: int = 20_000, chunk_size: int = 0) -> None:
+    items, size, chunk_size = int(items), int(size), int(chunk_size)
+    inputs = "(list " + " ".join([str(size)] * items) + ")"
+
+    ctx = STD_LIB()
+    Parser().Read(WORK + f"(defvar inputs {inputs})").Run(ctx, "compiled")
+
+    sequential = Parser().Read("(defvar results nil) (dolist (n inputs) (setf results (cons (work n) results)))")
+    base = best_of(lambda: sequential.Run(ctx, "compiled"), 1)
+    report(f"dolist, {items} items", base)
+
+    chunk = str(chunk_size) if chunk_size else "nil"
+    for workers in range(1, (os.cpu_count() or 1) + 1):
+        parallel = Parser().Read(f"(defvar presults (pmap work inputs {chunk} {workers}))")
+        # the first run starts the pool, so only warm runs are timed
+        parallel.Run(ctx, "compiled")
+        seconds = best_of(lambda: parallel.Run(ctx, "compiled"), 3)
+        report(f"pmap, {workers} workers", seconds, f"x{base / seconds:.2f}")
+
+    Parallel.shutdown()
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
@@ -0,0 +1,47 @@
+from __future__ import annotations
+import sys
+from Parser import Parser
+from Profiler import Profiler
+from std import STD_LIB
+from benchmarks.common import FIB, best_of, report
+
+
+# tail calls far deeper than the python stack, which profiling must not break
+COUNT = """
+(defun count (n) (if (= n 0) 0 (count (- n 1))))
+(defvar result (count {n}))
+"""
+
+
+def tail_calls(n: int, backend: str) -> None:
+    ctx = STD_LIB()
+    profiler = Profiler()
+    seconds = best_of(lambda: Parser().Read(COUNT.format(n=n)).Run(ctx, backend, profile=profiler), 1)
+    calls = profiler.stats["count"].calls
+    if ctx.Get("result").value != 0 or calls != n + 1:
+        raise Exception(f"profiled tail calls made {calls} calls, not {n + 1} [{backend}]")
+    report(f"count {n} tail calls [{backend}] profiled", seconds)
+
+
+def main(n: int = 18) -> None:
+    n = int(n)
+    parser = Parser().Read(FIB + f"(fib {n})")
+
+    for backend in ("tree", "compiled", "vm"):
+        off = best_of(lambda: parser.Run(STD_LIB(), backend), 3)
+        on = best_of(lambda: parser.Run(STD_LIB(), backend, profile=Profiler()), 3)
+        report(f"fib {n} [{backend}] profiling off", off)
+        report(f"fib {n} [{backend}] profiling on", on, f"x{on / off:.2f}")
+
+    # the tree walker has no tail calls to keep
+    for backend in ("compiled", "vm"):
+        tail_calls(50_000, backend)
+
+    profiler = Profiler()
+    parser.Run(STD_LIB(), profile=profiler)
+    print()
+    print(profiler.Report(limit=8))
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
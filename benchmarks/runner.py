@@ -0,0 +1,58 @@
+from __future__ import annotations
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.common import FIB, report
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUN = os.path.join(ROOT, "run.py")
+
+
+def timed(commands: list[list[str]], env: dict) -> float:
+    start = time.perf_counter()
+    for command in commands:
+        subprocess.run(command, cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    return time.perf_counter() - start
+
+
+def main(files: int = 20) -> None:
+    files = int(files)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # warm bytecode, as an installed runtime would start
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=os.path.join(directory, "pycache"))
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+        paths = []
+        for i in range(files):
+            paths.append(os.path.join(directory, f"job{i}.lisp"))
+            with open(paths[-1], "w") as f:
+                f.write(FIB + f"(print (fib {10 + i % 5}))")
+
+        python = [sys.executable, RUN, "-q"]
+        timed([python + paths], env)
+        report(f"{files} files, one process each", timed([python + [p] for p in paths], env))
+        report(f"{files} files, one batch process", timed([python + paths], env))
+
+        socket = os.path.join(directory, "lisp.sock")
+        server = subprocess.Popen(
+            [sys.executable, RUN, "--server", socket], cwd=ROOT, env=env, stderr=subprocess.DEVNULL
+        )
+        try:
+            while not os.path.exists(socket):
+                time.sleep(0.01)
+            timed([python + ["--submit", socket, paths[0]]], env)
+            one = timed([python + ["--submit", socket, p] for p in paths], env)
+            report(f"{files} files, submitted one at a time", one)
+            report(f"{files} files, submitted as one batch", timed([python + ["--submit", socket] + paths], env))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
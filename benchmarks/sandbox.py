@@ -0,0 +1,78 @@
+from __future__ import annotations
+import sys
+import time
+from Parser import Parser
+from Sandbox import Budget, BudgetExceeded, sandbox
+from benchmarks.common import FIB, best_of, report
+
+
+LOOP = "(do ((i 0 (+ i 1))) ((= i {n})) nil)"
+
+# every element is a call back into the machine from a python builtin
+CALLBACKS = "(dotimes (i {n}) (vmap (lambda (x) (* x 2)) #(1 2 3 4)))"
+
+RUNAWAY = "(do ((i 0 (+ i 1))) ((= i -1)) nil)"
+
+# one builtin call, or a few doublings, build far more than a slice charges
+LARGE = (
+    ("large string", '(* "xxxxxxxx" 50000000)'),
+    ("doubling", '(defvar s "xxxxxxxxxxxxxxxx") (dotimes (i 40) (setf s (concatenate \'string s s)))'),
+    ("large integer", "(factorial 1000000)"),
+)
+
+
+def check(name: str, source: str) -> None:
+    parser = Parser().Read(source)
+    for backend in ("tree", "compiled", "vm"):
+        start = time.perf_counter()
+        try:
+            parser.Run(sandbox(), backend, budget=Budget(allocations=50000, steps=100))
+        except BudgetExceeded as e:
+            report(f"{name} stopped [{backend}]", time.perf_counter() - start, f"{e.resource} budget")
+        else:
+            raise Exception(f"{name} ran past its allocation budget [{backend}]")
+
+
+def limits() -> Budget:
+    # generous enough to never run out, so every check is paid for
+    return Budget(steps=10**12, allocations=10**9, seconds=3600, output=10**9)
+
+
+def main(n: int = 20) -> None:
+    n = int(n)
+    sys.setrecursionlimit(100_000)
+
+    programs = (
+        (f"fib {n}", FIB + f"(fib {n})"),
+        (f"do loop {n * 1000}", LOOP.format(n=n * 1000)),
+        (f"vmap callbacks {n * 100}", CALLBACKS.format(n=n * 100)),
+    )
+
+    for name, source in programs:
+        parser = Parser().Read(source)
+        plain = best_of(lambda: parser.Run(sandbox(), "vm"), 5)
+        report(f"{name} [vm]", plain)
+
+        for label, make in (("no limits", Budget), ("all limits", limits)):
+            budget = make()
+            seconds = best_of(lambda: parser.Run(sandbox(), budget=budget), 5)
+            overhead = (seconds / plain - 1) * 100
+            report(f"{name} [budget, {label}]", seconds, f"{overhead:+.1f}%  {budget.Report()}")
+
+    for name, source in LARGE:
+        check(name, source)
+
+    # how quickly a runaway snippet is stopped once its deadline passes
+    parser = Parser().Read(RUNAWAY)
+    for deadline in (0.01, 0.1):
+        start = time.perf_counter()
+        try:
+            parser.Run(sandbox(), budget=Budget(seconds=deadline))
+        except BudgetExceeded as e:
+            late = (time.perf_counter() - start - deadline) * 1000
+            report(f"runaway stopped, {deadline}s deadline", time.perf_counter() - start,
+                   f"{e.resource} budget, {late:.2f} ms late")
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
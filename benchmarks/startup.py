@@ -0,0 +1,76 @@
+from __future__ import annotations
+import os
+import subprocess
+import sys
+import tempfile
+from benchmarks.common import report
+
+
+# the headless runtime: importing it and running a script must not load any
+# of these, which belong to the repl, asyncio or process pools
+FORBIDDEN = ("prompt_toolkit", "pygments", "asyncio", "concurrent", "multiprocessing", "ast", "pyclbr")
+
+SCRIPT = "from Parser import Parser; from std import STD_LIB; Parser().Read('(+ 1 2)').Run(STD_LIB(), '{backend}')"
+
+# cumulative import time allowed for the modules of this repo, in ms
+LIMIT = 60.0
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OURS = {os.path.splitext(name)[0] for name in os.listdir(ROOT) if name.endswith(".py")}
+
+
+def importtime(code: str, env: dict) -> list[tuple[str, int, int]]:
+    # (module, self us, cumulative us) for every import, in import order
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, total, name = line[len("import time:") :].split("|")
+        if own.strip().isdigit():
+            rows.append((name.strip(), int(own), int(total)))
+
+    return rows
+
+
+def main(repeat: int = 5) -> None:
+    with tempfile.TemporaryDirectory() as cache:
+        # measured with warm bytecode, as an installed runtime would start
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=cache)
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+        failures = []
+        for backend in ("tree", "vm"):
+            code = SCRIPT.format(backend=backend)
+            importtime(code, env)
+            runs = [importtime(code, env) for _ in range(int(repeat))]
+
+            best = min(runs, key=lambda rows: sum(own for name, own, _ in rows if name in OURS))
+            ours = sum(own for name, own, _ in best if name in OURS) / 1000
+            everything = sum(own for _, own, _ in best) / 1000
+            report(f"headless imports [{backend}]", everything / 1000, f"repo modules {ours:.2f} ms")
+
+            for name, own, total in sorted(best, key=lambda row: -row[2])[:5]:
+                print(f"    {name:<36} {own / 1000:>8.2f} ms self {total / 1000:>8.2f} ms cumulative")
+
+            loaded = {name.split(".")[0] for name, _, _ in best}
+            failures += [f"{name} is imported by the {backend} runtime" for name in FORBIDDEN if name in loaded]
+            if ours > LIMIT:
+                failures.append(f"repo modules took {ours:.2f} ms to import, over {LIMIT} ms")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,32 @@
+from __future__ import annotations
+import io
+import sys
+import time
+import tracemalloc
+from Parser import Parser
+from std import STD_LIB
+
+
+def generate(forms: int) -> str:
+    return "(defvar x 0)\n" + "(setf x (+ x 1)) ; counter\n" * forms
+
+
+def measure(name: str, run) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    run()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<20} {seconds * 1000:>10.2f} ms  peak {peak / 1024 / 1024:8.2f} MB")
+
+
+def main(forms: int = 20_000) -> None:
+    code = generate(int(forms))
+
+    measure("Read + Run", lambda: Parser().Read(code).Run(STD_LIB()))
+    measure("RunStream", lambda: Parser().RunStream(STD_LIB(), io.StringIO(code)))
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:]))
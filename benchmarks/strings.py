@@ -0,0 +1,80 @@
+from __future__ import annotations
+import sys
+import time
+from Lexer import STRING
+from Parser import Atom, Function, Parser
+from std import NIL, STD_LIB, _str
+from benchmarks.common import best_of, report
+
+
+def legacy_format(ctx, stdout: Atom, fstring: Atom, *args) -> Atom:
+    # format as it was, re-reading the control string on every call
+    out = fstring.value.replace("~%", "\n").replace("~s", "{}").replace("~S", "{}")
+    out = out.format(*[_str(ctx, a) for a in args])
+
+    if stdout != NIL:
+        print(out, end="")
+
+    return Atom(value=out, type=STRING)
+
+
+ROW = '"~s,~s,~s,~s~%" i "customer" "somewhere" (* i 7)'
+
+CALLS = "(dotimes (i {n}) ({format} nil {row}))"
+
+# without string streams a report is built by concatenating each row on
+CONCATENATED = """
+(defvar report "")
+(dotimes (i {rows})
+    (setf report (concatenate 'string report (legacy-format nil {row}))))
+"""
+
+STREAMED = """
+(defvar report
+    (with-output-to-string (out)
+        (dotimes (i {rows})
+            (format out {row}))))
+"""
+
+
+def context():
+    ctx = STD_LIB()
+    ctx.scope["legacy-format"] = Function(legacy_format)
+    return ctx
+
+
+def built(source: str, backend: str) -> tuple[float, int]:
+    ctx = context()
+    parser = Parser().Read(source)
+    start = time.perf_counter()
+    parser.Run(ctx, backend)
+    return time.perf_counter() - start, len(ctx.Get("report").value)
+
+
+def main(megabytes: float = 50, backend: str = "vm") -> None:
+    megabytes = float(megabytes)
+    row_size = len(f"{10**6},\"customer\",\"somewhere\",{7 * 10**6}\n")
+    rows = int(megabytes * 2**20 / row_size)
+
+    for name, format in (("legacy format", "legacy-format"), ("compiled format", "format")):
+        parser = Parser().Read(CALLS.format(n=100_000, format=format, row=ROW))
+        seconds = best_of(lambda: parser.Run(context(), backend), 3)
+        report(f"{name} 100000 calls [{backend}]", seconds, f"{seconds * 10:.2f} us each")
+
+    # the concatenating loop copies the whole report for every row, so it is
+    # timed on a small report and projected to the full size
+    small = max(1, rows // 50)
+    seconds, size = built(CONCATENATED.format(rows=small, row=ROW), backend)
+    projected = seconds * (rows / small) ** 2
+    report(f"concatenated {size / 2**20:.1f} MB report [{backend}]", seconds, f"{megabytes:g} MB ~ {projected:.0f} s")
+
+    seconds, size = built(STREAMED.format(rows=rows, row=ROW), backend)
+    report(
+        f"streamed {size / 2**20:.1f} MB report [{backend}]",
+        seconds,
+        f"{size / 2**20 / seconds:.1f} MB/s",
+    )
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
@@ -11,7 +11,8 @@ with open("test.lisp", "r") as f:
 ctx = STD_LIB()  # or Context()
 
 
-@ctx.func
+# memoize caches results by argument with LRU eviction, see fibb.memo.Stats()
+@ctx.func(memoize=True, max_size=256)
 def fibb(n: int) -> int:
     if n == 0:
         return 0
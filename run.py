@@ -0,0 +1,228 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+from typing import Optional
+
+
+# the headless entry point. Every file, -e expression and stdin runs in one
+# process over the shared builtins, each in its own globals unless --share
+# is given, with parsed files kept in the on-disk parse cache:
+#
+#   python run.py a.lisp b.lisp -e "(print (+ 1 2))" --backend vm
+#   python run.py --server /tmp/lisp.sock
+#   python run.py --submit /tmp/lisp.sock a.lisp b.lisp
+#
+# With nothing to run and a terminal on stdin it starts the repl. The
+# interpreter is only imported by the process that runs jobs, so submitting
+# to a server starts as fast as python itself.
+
+BACKENDS = ("tree", "compiled", "vm")
+
+
+def arguments(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="run.py", description="Run lisp files and expressions")
+    parser.add_argument("files", nargs="*", help="files to run in order, - for stdin")
+    parser.add_argument("-e", dest="expressions", action="append", default=[], help="an expression to run")
+    parser.add_argument("--backend", choices=BACKENDS, default="tree")
+    parser.add_argument("--deep", action="store_true", help="allow deep non-tail recursion")
+    parser.add_argument("--share", action="store_true", help="run every job in the same globals")
+    parser.add_argument("--no-cache", action="store_true", help="parse files without the parse cache")
+    parser.add_argument("-q", "--quiet", action="store_true", help="do not report timings")
+    parser.add_argument("--server", metavar="SOCKET", help="serve jobs on a unix socket")
+    parser.add_argument("--submit", metavar="SOCKET", help="run the jobs on a server")
+    return parser.parse_args(argv)
+
+
+def jobs(args: argparse.Namespace) -> list[dict]:
+    # each job is a file path or source text, named for the timing report
+    result = []
+    for path in args.files:
+        if path == "-":
+            result.append({"name": "<stdin>", "source": sys.stdin.read()})
+        else:
+            result.append({"name": path, "path": os.path.abspath(path)})
+
+    for i, expression in enumerate(args.expressions):
+        result.append({"name": f"-e {i + 1}", "source": expression})
+
+    if not result and not sys.stdin.isatty():
+        result.append({"name": "<stdin>", "source": sys.stdin.read()})
+
+    return result
+
+
+class Runner:
+    # a warm interpreter: the builtins, the parse cache and, with share, the
+    # globals are kept between jobs
+    def __init__(self, backend: str = "tree", deep: bool = False, share: bool = False, cache: bool = True):
+        from std import STD_LIB
+
+        self.backend = backend
+        self.deep = deep
+        self.share = share
+        self.context = STD_LIB
+        self.ctx = STD_LIB()
+        # where the jobs print to, stdout when None
+        self.output = None
+        self.cache = None
+        if cache:
+            from Cache import Cache
+
+            self.cache = Cache()
+
+    def Read(self, job: dict) -> Parser:
+        from Parser import Parser
+
+        parser = Parser()
+        if "path" not in job:
+            return parser.Read(job["source"])
+        if self.cache is not None:
+            return self.cache.ReadFile(parser, job["path"])
+
+        with open(job["path"], "r") as f:
+            return parser.Read(f.read())
+
+    def Run(self, job: dict) -> dict:
+        # read and run seconds and any error, for the report; a failing job
+        # does not stop the ones after it
+        timing = {"name": job["name"], "read": 0.0, "run": 0.0, "error": None}
+        ctx = self.ctx if self.share else self.context()
+        ctx.output = self.output
+
+        start = time.perf_counter()
+        try:
+            parser = self.Read(job)
+            timing["read"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            parser.Run(ctx, self.backend, self.deep)
+            timing["run"] = time.perf_counter() - start
+        except Exception as e:
+            timing["error"] = f"{type(e).__name__}: {e}"
+
+        return timing
+
+    def RunAll(self, jobs: list[dict]) -> list[dict]:
+        return [self.Run(job) for job in jobs]
+
+
+def report(timings: list[dict], out=sys.stderr):
+    for t in timings:
+        status = f"  {t['error']}" if t["error"] else ""
+        print(
+            f"{t['name']:<40} read {t['read'] * 1000:>9.2f} ms  run {t['run'] * 1000:>9.2f} ms{status}",
+            file=out,
+        )
+
+    if len(timings) > 1:
+        total = sum(t["read"] + t["run"] for t in timings)
+        print(f"{f'{len(timings)} jobs':<40} total {total * 1000:>9.2f} ms", file=out)
+
+
+def receive(connection: socket.socket) -> bytes:
+    chunks = []
+    while chunk := connection.recv(65536):
+        chunks.append(chunk)
+
+    return b"".join(chunks)
+
+
+def validate(request: object) -> list[dict]:
+    # {"jobs": [{"name": ..., "path" or "source": ...}, ...]}
+    if not isinstance(request, dict) or not isinstance(request.get("jobs"), list):
+        raise ValueError("a request is an object with a list of jobs")
+
+    for job in request["jobs"]:
+        if not isinstance(job, dict) or not isinstance(job.get("name"), str):
+            raise ValueError("every job is an object with a name")
+        if not isinstance(job.get("path", job.get("source")), str):
+            raise ValueError(f"job {job['name']} has no path or source")
+
+    return request["jobs"]
+
+
+def serve(path: str, runner: Runner):
+    # one job list per connection, run in order: the client sends a json
+    # request and closes its side, and gets back the output and timings
+    from Output import CaptureSink
+
+    if os.path.exists(path):
+        os.remove(path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    print(f"serving on {path}", file=sys.stderr)
+
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection:
+                # a bad request or a failure while serving it is answered
+                # with an error, and the server keeps going
+                try:
+                    work = validate(json.loads(receive(connection)))
+                    out = runner.output = CaptureSink()
+                    timings = runner.RunAll(work)
+                    reply = {"output": out.Value(), "timings": timings}
+                except Exception as e:
+                    reply = {"output": "", "timings": [], "error": f"{type(e).__name__}: {e}"}
+
+                try:
+                    connection.sendall(json.dumps(reply).encode())
+                except OSError as e:
+                    print(f"could not reply: {e}", file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.remove(path)
+
+
+def submit(path: str, jobs: list[dict]) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        connection.sendall(json.dumps({"jobs": jobs}).encode())
+        connection.shutdown(socket.SHUT_WR)
+        return json.loads(receive(connection))
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = arguments(argv)
+    if args.server:
+        serve(args.server, Runner(args.backend, args.deep, args.share, not args.no_cache))
+        return 0
+
+    work = jobs(args)
+    if args.submit:
+        response = submit(args.submit, work)
+        if response.get("error"):
+            print(response["error"], file=sys.stderr)
+            return 1
+        sys.stdout.write(response["output"])
+        timings = response["timings"]
+    elif not work:
+        from Parser import Parser
+        from std import STD_LIB
+
+        Parser().Repl(STD_LIB())
+        return 0
+    else:
+        timings = Runner(args.backend, args.deep, args.share, not args.no_cache).RunAll(work)
+
+    if not args.quiet:
+        report(timings)
+    else:
+        for t in timings:
+            if t["error"]:
+                print(f"{t['name']}: {t['error']}", file=sys.stderr)
+
+    return 1 if any(t["error"] for t in timings) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,18 +1,34 @@
-from os import access
-from typing import Union
+from typing import Any, Callable, Iterable, Iterator, Sequence
+import gc
+import io
 import math
-from Lexer import TokenType, Token
-from Parser import Context, Atom, Expression, Function
+import mmap
+from array import array
+from itertools import chain, islice, repeat
+from Lexer import INTEGER, FLOAT, STRING, SYMBOL, SPECIAL, LIST, ARRAY, HASH_TABLE, STREAM, SEQUENCE
+from Parser import Context, Atom, Cons, Expression, Function, Primitive, integer, symbol, PYTHON_TYPES
+from Sandbox import BUDGET, Budget
 import operator as op
-from functools import reduce
 
 
-NIL = Atom(value="NIL", type=TokenType.SYMBOL)
-T = Atom(value="T", type=TokenType.SYMBOL)
+NIL = symbol("NIL")
+T = symbol("T")
+
+
+def lambda_form(args: Expression, body: tuple[Expression]) -> Expression:
+    return Expression([symbol("lambda"), args, *body])
+
+
+def arity_error(expected: int, given: int) -> Exception:
+    # raised by every backend for a call with fewer arguments than parameters;
+    # extra arguments are ignored
+    return Exception(f"Expected {expected} arguments but got {given}")
 
 
 def defun(ctx: Context, name: Atom, args: Expression, *body: list[Expression]) -> Atom:
     def func(_, *params) -> Atom:
+        if len(params) < len(args.value):
+            raise arity_error(len(args.value), len(params))
         scope = Context(parent=ctx)
 
         for key, value in zip(args.value, params):
@@ -22,13 +38,63 @@ def defun(ctx: Context, name: Atom, args: Expression, *body: list[Expression]) -
             result = b(scope)
         return result
 
-    f = Function(func)
+    f = Function(func, lambda_form(args, body))
     ctx.Set(name.value, f)
     return f
 
 
+def defun_memo(
+    ctx: Context, spec: Atom, args: Expression, *body: list[Expression]
+) -> Atom:
+    from Memo import memo_spec, memoize
+
+    name, size = memo_spec(spec)
+    f = memoize(_lambda(ctx, args, *body), name, size)
+    ctx.Set(name, f)
+    return f
+
+
+def memo_stats(ctx: Context, function: Atom) -> Atom:
+    # defun-memo functions carry their memo, python ones memoized through
+    # Context.func carry it on the wrapped callable
+    memo = getattr(function, "memo", None) or getattr(getattr(function, "func", None), "memo", None)
+    if memo is None:
+        raise Exception(f"{_str(ctx, function)} is not memoized")
+
+    stats = memo.Stats()
+    return build_list(
+        [build_list([symbol(k), NIL if v is None else box(v)]) for k, v in stats.items()]
+    )
+
+
+def profile(ctx: Context, *body: list[Expression]) -> Atom:
+    # (profile ["stacks.folded"] body...) prints a report of the body and
+    # optionally writes its collapsed stacks for a flamegraph
+    from Profiler import Profiler
+
+    path = None
+    if body and body[0].type is STRING:
+        path, body = body[0].value, body[1:]
+
+    profiler = Profiler().Attach(ctx)
+    try:
+        result = NIL
+        for b in body:
+            result = b(ctx)
+    finally:
+        profiler.Detach()
+
+    ctx.Output().Write(profiler.Report() + "\n")
+    if path is not None:
+        profiler.WriteCollapsed(path)
+
+    return result
+
+
 def _lambda(ctx: Context, args: Expression, *body: list[Expression]) -> Atom:
     def func(_, *params) -> Atom:
+        if len(params) < len(args.value):
+            raise arity_error(len(args.value), len(params))
         scope = Context(parent=ctx)
 
         for key, value in zip(args.value, params):
@@ -39,7 +105,7 @@ def _lambda(ctx: Context, args: Expression, *body: list[Expression]) -> Atom:
 
         return result
 
-    return Function(func)
+    return Function(func, lambda_form(args, body))
 
 
 def progn(ctx: Context, *body: list[Expression]) -> Atom:
@@ -56,14 +122,16 @@ def loop(ctx: Context, func: Atom, n: Atom) -> Atom:
     return result
 
 
-def dotimes(ctx: Context, args: Expression, body: Expression) -> Atom:
+def dotimes(ctx: Context, args: Expression, *body: list[Expression]) -> Atom:
     scope = Context(parent=ctx)
+    result = NIL
     for i in range(args.value[1](ctx).value):
-        scope.Set(args.value[0].value, Atom(type=TokenType.INTEGER, value=i))
-        result = body(scope)
+        scope.Set(args.value[0].value, integer(i))
+        for b in body:
+            result = b(scope)
 
     if len(args.value) > 2:
-        result = args.value[2](ctx).value
+        result = args.value[2](scope)
 
     return result
 
@@ -72,7 +140,7 @@ def let(ctx: Context, args: Expression, *body: list[Expression]) -> Atom:
     scope = Context(parent=ctx)
 
     for arg in args.value:
-        scope.Set(arg.value[0].value, arg.value[1])
+        scope.Set(arg.value[0].value, arg.value[1](ctx))
 
     for b in body:
         result = b(scope)
@@ -87,10 +155,9 @@ def do(
 
     incs = []
     for arg in args.value:
-        scope.Set(arg.value[0].value, arg.value[1])
-        incs.append(
-            (arg.value[0].value, arg.value[2] if len(arg.value) > 2 else arg.value[1])
-        )
+        scope.Set(arg.value[0].value, arg.value[1](ctx))
+        if len(arg.value) > 2:
+            incs.append((arg.value[0].value, arg.value[2]))
 
     incs.reverse()
     while end.value[0](scope) == NIL:
@@ -104,18 +171,26 @@ def do(
 
 
 def iterate_over_atom(ctx: Context, iterable: Atom) -> Atom:
-    if iterable.type == TokenType.ARRAY or iterable.type == TokenType.STRING:
-        for atom in iterable.value:
-            yield atom
+    if iterable.value.__class__ is array or iterable.value.__class__ is memoryview:
+        yield from map(box, iterable.value)
+    elif iterable.type is ARRAY or iterable.type is STRING:
+        yield from iterable.value
+    elif iterable.type is HASH_TABLE:
+        # (key . value) pairs, from a snapshot so the body may change the table
+        for key, value in list(iterable.value.values()):
+            yield Cons(key, value)
+    elif iterable.type is SEQUENCE:
+        # a lazy sequence holds a function making a new iterator of atoms
+        yield from iterable.value()
     else:
-        n = iterable
-        yield car(ctx, n)
-        while (n := cdr(ctx, n)) != NIL:
-            yield car(ctx, n)
+        while iterable.__class__ is Cons:
+            yield iterable.value
+            iterable = iterable.cdr
 
 
 def dolist(ctx: Context, args: Expression, *body: list[Expression]) -> Atom:
     scope = Context(parent=ctx)
+    result = NIL
 
     for atom in iterate_over_atom(ctx, args.value[1](ctx)):
         scope.Set(args.value[0].value, atom)
@@ -129,7 +204,36 @@ def dolist(ctx: Context, args: Expression, *body: list[Expression]) -> Atom:
     return result
 
 
+def optional_integer(atom: Atom = None) -> int:
+    return atom.value if atom is not None and atom.type is INTEGER else None
+
+
+def pmap(
+    ctx: Context, function: Atom, sequence: Atom, chunk_size: Atom = None, workers: Atom = None
+) -> Atom:
+    # (pmap fn list [chunk-size [workers]]) maps fn over the list in worker
+    # processes and returns the results in order
+    from Parallel import parallel_map
+
+    return parallel_map(
+        ctx, function, sequence, optional_integer(chunk_size), optional_integer(workers)
+    )
+
+
+def pdolist(ctx: Context, args: Expression, *body: list[Expression]) -> Atom:
+    # (pdolist (x list [chunk-size]) body...) runs the body for every element
+    # in worker processes and returns the list of its values
+    from Parallel import parallel_map
+
+    form = lambda_form(Expression([args.value[0]]), body)
+    chunk_size = optional_integer(args.value[2](ctx)) if len(args.value) > 2 else None
+    return parallel_map(ctx, form, args.value[1](ctx), chunk_size)
+
+
 def aref(ctx: Context, iterable: Atom, index: Atom) -> Atom:
+    if iterable.value.__class__ is array or iterable.value.__class__ is memoryview:
+        return box(iterable.value[index.value])
+
     return iterable.value[index.value]
 
 
@@ -168,23 +272,31 @@ def cond(ctx: Context, *conditions: list[Expression]) -> Atom:
     return NIL
 
 
-def _repr(_ctx: Context, atom: Atom) -> Atom:
-    atom.print()
+def _repr(ctx: Context, atom: Atom) -> Atom:
+    out = io.StringIO()
+    atom.print(file=out)
+    ctx.Output().Write(out.getvalue())
     return atom
 
 
 def defvar(ctx: Context, name: Atom, value: Atom = None) -> Atom:
-    if name.type != TokenType.SYMBOL:
+    if name.type is not SYMBOL:
         raise Exception("Variable not a symbol")
 
-    ctx.set_on_parent(name.value, value(ctx) if value else NIL)
+    value = value(ctx) if value else NIL
+    ctx.set_on_parent(name.value, value)
     return value
 
 
 def setf(ctx: Context, atom: Atom, value: Atom) -> Atom:
     # if atom.value not in ctx.scope:
     #     raise Exception(f"The VARIABLE {atom.value} is UNBOUND")
-    ctx.FindAndSet(atom.value, value(ctx))
+    if isinstance(atom, Expression):
+        args = [arg(ctx) for arg in atom.value[1:]]
+        return setter(atom)(ctx, *args, value(ctx))
+
+    value = value(ctx)
+    ctx.FindAndSet(atom.value, value)
 
     return value
 
@@ -193,25 +305,22 @@ def STD_MATH() -> dict:
     return {k: v for k, v in vars(math).items() if callable(v)}
 
 
-def build_list(l: list[Union[Atom, Token]], end: Atom = None):
-    if len(l) == 1:
-        return Atom(
-            [
-                Atom(value=l[0].value, type=l[0].type)
-                if isinstance(l[0], Token)
-                else l[0],
-                end or NIL,
-            ],
-            TokenType.LIST,
-        )
+def build_list(l: Sequence[Atom], end: Atom = NIL) -> Atom:
+    # new cells cannot form a cycle among themselves, so the cyclic collector
+    # is paused rather than rescanning a long list after every few hundred
+    paused = gc.isenabled() and len(l) > 1000
+    if paused:
+        gc.disable()
 
-    return Atom(
-        [
-            Atom(value=l[0].value, type=l[0].type) if isinstance(l[0], Token) else l[0],
-            build_list(l[1:]),
-        ],
-        TokenType.LIST,
-    )
+    try:
+        result = end
+        for item in reversed(l):
+            result = Cons(item, result)
+    finally:
+        if paused:
+            gc.enable()
+
+    return result
 
 
 def _list(ctx: Context, *items: list[Atom]) -> Atom:
@@ -219,72 +328,817 @@ def _list(ctx: Context, *items: list[Atom]) -> Atom:
 
 
 def car(_ctx: Context, l: Atom) -> Atom:
-    if isinstance(l.value, Atom):
-        return l.value.value[0]
+    if l.__class__ is Cons:
+        return l.value
 
-    return l.value[0]
+    if l is NIL:
+        return NIL
+
+    raise Exception(f"{_str(_ctx, l)} is not a list")
 
 
 def cdr(_ctx: Context, l: Atom) -> Atom:
-    if isinstance(l.value, Atom):
-        return Atom(l.value[-1], TokenType.LIST)
+    if l.__class__ is Cons:
+        return l.cdr
 
-    return l.value[-1]
+    if l is NIL:
+        return NIL
+
+    raise Exception(f"{_str(_ctx, l)} is not a list")
 
 
 def elt(ctx: Context, iterable: Atom, index: Atom) -> Atom:
-    for i, atom in enumerate(iterate_over_atom(ctx, iterable)):
-        if i == index.value:
-            return atom
+    i = index.value
+    if iterable.type is ARRAY or iterable.type is STRING:
+        if 0 <= i < len(iterable.value):
+            if iterable.value.__class__ is array or iterable.value.__class__ is memoryview:
+                return box(iterable.value[i])
+            return iterable.value[i]
+    elif iterable.type is SEQUENCE:
+        if i >= 0 and (item := next(islice(iterate_over_atom(ctx, iterable), i, None), None)) is not None:
+            return item
+    elif i >= 0:
+        while iterable.__class__ is Cons:
+            if i == 0:
+                return iterable.value
+            iterable = iterable.cdr
+            i -= 1
 
     raise Exception("Index Out of Bounds")
 
 
 def cons(ctx: Context, a: Atom, b: Atom) -> Atom:
-    return build_list([a], end=b)
+    return Cons(a, b)
 
 
-def _str(ctx: Context, v: Atom) -> str:
-    if isinstance(v, Atom):
-        if v.type == TokenType.STRING:
-            return f'"{v.value}"'
-        elif v.type == TokenType.LIST:
-            s = [str(atom.value) for atom in iterate_over_atom(ctx, v)]
-            return "(" + " ".join(s) + ")"
+# a hash table's value is a dict from the hash key of each key atom to the
+# (key, value) pair, so keys compare like equal: by type and value, with
+# lists and arrays compared element by element
+def hash_key(atom: Atom) -> Any:
+    type = atom.type
+    if type is None:
+        # atoms made by python code may be left untyped
+        type = PYTHON_TYPES.get(atom.value.__class__)
+    if type is SYMBOL or type is SPECIAL:
+        # 'a reads as a special symbol and a quoted (a) holds a lowercase
+        # symbol, but both name the same key
+        return (SYMBOL, atom.value.upper())
 
-        else:
-            return str(v.value)
+    if type is LIST:
+        items = []
+        while atom.__class__ is Cons:
+            items.append(hash_key(atom.value))
+            atom = atom.cdr
+        return (LIST, tuple(items), hash_key(atom))
+
+    if type is ARRAY:
+        if atom.value.__class__ is array:
+            return (ARRAY, atom.value.typecode, tuple(atom.value))
+        if atom.value.__class__ is memoryview:
+            # bytes are integers, so they key like an integer array
+            return (ARRAY, "q", tuple(atom.value))
+        return (ARRAY, tuple([hash_key(a) for a in atom.value]))
+
+    return (type, atom.value)
+
+
+def make_hash_table(ctx: Context, size: Atom = None) -> Atom:
+    # the size hint is accepted like common lisp's, and not needed by a dict
+    return Atom(value={}, type=HASH_TABLE)
+
+
+def hash_table(ctx: Context, table: Atom) -> dict:
+    if table.type is not HASH_TABLE:
+        raise Exception(f"{_str(ctx, table)} is not a hash table")
+
+    return table.value
+
+
+def gethash(ctx: Context, key: Atom, table: Atom, default: Atom = NIL) -> Atom:
+    try:
+        entry = hash_table(ctx, table).get(hash_key(key))
+    except TypeError:
+        raise Exception(f"{_str(ctx, key)} cannot be a hash table key")
+
+    return default if entry is None else entry[1]
+
+
+def sethash(ctx: Context, key: Atom, table: Atom, value: Atom) -> Atom:
+    try:
+        hash_table(ctx, table)[hash_key(key)] = (key, value)
+    except TypeError:
+        raise Exception(f"{_str(ctx, key)} cannot be a hash table key")
+
+    return value
+
+
+def remhash(ctx: Context, key: Atom, table: Atom) -> Atom:
+    entries = hash_table(ctx, table)
+    # pop skips hashing the key when the table is empty, but in does not
+    try:
+        found = (k := hash_key(key)) in entries
+    except TypeError:
+        raise Exception(f"{_str(ctx, key)} cannot be a hash table key")
+
+    if not found:
+        return NIL
+    del entries[k]
+    return T
+
+
+def maphash(ctx: Context, function: Atom, table: Atom) -> Atom:
+    for key, value in list(hash_table(ctx, table).values()):
+        function(ctx, key, value)
+
+    return NIL
+
+
+def hash_table_count(ctx: Context, table: Atom) -> Atom:
+    return integer(len(hash_table(ctx, table)))
+
+
+# (setf (place args...) value) calls the setter with the evaluated args and
+# value; every backend goes through this table
+SETTERS = {
+    "gethash": sethash,
+}
+
+
+def setter(place: Expression) -> Callable:
+    name = place.value[0].value
+    if (function := SETTERS.get(name)) is None:
+        raise Exception(f"Cannot setf {name}")
+
+    return function
+
+
+def length(ctx: Context, sequence: Atom) -> Atom:
+    if sequence.__class__ is Cons:
+        count = 0
+        while sequence.__class__ is Cons:
+            count += 1
+            sequence = sequence.cdr
+        return integer(count)
+
+    if sequence is NIL:
+        return integer(0)
+
+    if sequence.type is SEQUENCE:
+        # counted by walking it, so an infinite sequence never returns
+        return integer(sum(1 for _ in iterate_over_atom(ctx, sequence)))
+
+    return integer(len(sequence.value))
+
+
+# arrays of only integers or only floats keep their elements unboxed in an
+# array.array; anything else is a list of atoms
+TYPECODES = {INTEGER: "q", FLOAT: "d"}
+
+
+def box(value: Any) -> Atom:
+    if value.__class__ is int:
+        return integer(value)
+
+    if value.__class__ is float:
+        return Atom(value=value, type=FLOAT)
+
+    return Atom(value)
+
+
+def make_array(items: list[Atom]) -> Atom:
+    if items and (code := TYPECODES.get(items[0].type)):
+        kind = items[0].type
+        if all(item.type is kind for item in items):
+            try:
+                return Atom(value=array(code, [item.value for item in items]), type=ARRAY)
+            except OverflowError:
+                pass
+
+    return Atom(value=list(items), type=ARRAY)
+
+
+def pack(values: Iterable[Any], code: str = None) -> Atom:
+    values = list(values)
+    if code == "d":
+        return Atom(value=array(code, values), type=ARRAY)
+
+    try:
+        return Atom(value=array("q", values), type=ARRAY)
+    except (TypeError, OverflowError):
+        pass
+
+    if values and all(v.__class__ is float for v in values):
+        return Atom(value=array("d", values), type=ARRAY)
+
+    return Atom(value=[box(v) for v in values], type=ARRAY)
+
+
+def numbers(ctx: Context, v: Atom) -> Sequence[Any]:
+    if v.value.__class__ is array or v.value.__class__ is memoryview:
+        return v.value
+
+    if v.type is ARRAY:
+        return [item.value for item in v.value]
+
+    raise Exception(f"{_str(ctx, v)} is not an array")
+
+
+def elementwise(ctx: Context, func: Callable, a: Atom, b: Atom) -> Atom:
+    x = numbers(ctx, a)
+    if b.type is ARRAY:
+        y = numbers(ctx, b)
+        if len(x) != len(y):
+            raise Exception(f"Arrays of length {len(x)} and {len(y)} do not match")
     else:
+        y = repeat(b.value, len(x))
+
+    # numbers combined with a float are floats, so the result type is known
+    floats = "d" in (getattr(x, "typecode", ""), getattr(y, "typecode", ""))
+    return pack(map(func, x, y), "d" if floats or b.value.__class__ is float else None)
+
+
+def vadd(ctx: Context, a: Atom, b: Atom) -> Atom:
+    return elementwise(ctx, op.add, a, b)
+
+
+def vmul(ctx: Context, a: Atom, b: Atom) -> Atom:
+    return elementwise(ctx, op.mul, a, b)
+
+
+def vsum(ctx: Context, a: Atom) -> Atom:
+    return box(sum(numbers(ctx, a)))
+
+
+def vdot(ctx: Context, a: Atom, b: Atom) -> Atom:
+    x, y = numbers(ctx, a), numbers(ctx, b)
+    if len(x) != len(y):
+        raise Exception(f"Arrays of length {len(x)} and {len(y)} do not match")
+
+    return box(sum(map(op.mul, x, y)))
+
+
+def vmap(ctx: Context, func: Atom, a: Atom) -> Atom:
+    if isinstance(func, Primitive):
+        return pack(map(func.func, numbers(ctx, a)))
+
+    return pack(func(ctx, item).value for item in iterate_over_atom(ctx, a))
+
+
+def vslice(ctx: Context, a: Atom, start: Atom, end: Atom = None) -> Atom:
+    if a.type is not ARRAY:
+        raise Exception(f"{_str(ctx, a)} is not an array")
+
+    return Atom(value=a.value[start.value : end.value if end else None], type=ARRAY)
+
+
+def append(ctx: Context, a: Atom, v: Atom) -> Atom:
+    if a.value.__class__ is memoryview:
+        raise Exception("Byte arrays are read only")
+
+    if a.value.__class__ is array:
+        if TYPECODES.get(v.type) == a.value.typecode:
+            try:
+                a.value.append(v.value)
+                return a
+            except OverflowError:
+                pass
+
+        # no longer homogeneous, so the array falls back to boxed atoms
+        a.value = [box(item) for item in a.value]
+
+    a.value.append(v)
+    return a
+
+
+# how much of a lazy sequence is printed, since it may be infinite
+PRINT_LENGTH = 1000
+
+
+def _str(ctx: Context, v: Atom, escape: bool = True) -> str:
+    # escape quotes strings, like ~s; without it they print as is, like ~a
+    if not isinstance(v, Atom):
         return str(v)
 
+    type = v.type
+    if type is STRING:
+        return f'"{v.value}"' if escape else v.value
+    elif type is INTEGER or type is FLOAT or type is SYMBOL:
+        return str(v.value)
+    elif type is LIST:
+        s = []
+        while v.__class__ is Cons:
+            s.append(_str(ctx, v.value, escape))
+            v = v.cdr
+        if v is not NIL:
+            s.extend((".", _str(ctx, v, escape)))
+        return "(" + " ".join(s) + ")"
+    elif type is ARRAY:
+        return "#(" + " ".join([_str(ctx, e, escape) for e in iterate_over_atom(ctx, v)]) + ")"
+    elif type is HASH_TABLE:
+        return f"#<HASH-TABLE :TEST EQUAL :COUNT {len(v.value)}>"
+    elif type is STREAM:
+        if v.value.__class__ is io.StringIO:
+            return "#<STRING-OUTPUT-STREAM>"
+        return f'#<FILE-STREAM "{v.value.name}">'
+    elif type is SEQUENCE:
+        # printed like a list, up to PRINT_LENGTH elements
+        items = list(islice(iterate_over_atom(ctx, v), PRINT_LENGTH + 1))
+        s = [_str(ctx, item, escape) for item in items[:PRINT_LENGTH]]
+        if len(items) > PRINT_LENGTH:
+            s.append("...")
+        return "(" + " ".join(s) + ")"
 
-def _format(ctx: Context, stdout: Atom, fstring: Atom, *args: list[Atom]) -> Atom:
-    out = fstring.value.replace("~%", "\n").replace("~s", "{}").replace("~S", "{}")
-    out = out.format(*[_str(ctx, a) for a in args])
+    return str(v.value)
 
-    if stdout != NIL:
-        print(out, end="")
 
-    return Atom(value=out, type=TokenType.STRING)
+# a control string is compiled once and kept by the string. Without ~{ or
+# ~^ it becomes one str.format template with a converter per directive,
+# otherwise its parts are walked for each call
+FORMATS: dict[str, tuple[Any, list]] = {}
 
+FORMATS_SIZE = 1024
 
-def _print(ctx: Context, v: Atom) -> Atom:
-    if isinstance(v, Atom):
-        if v.type == TokenType.STRING:
-            print(f'"{v.value}"')
-        elif v.type == TokenType.LIST:
-            s = [_str(ctx, atom) for atom in iterate_over_atom(ctx, v)]
-            print("(" + " ".join(s) + ")")
-        elif v.type == TokenType.ARRAY:
-            print("#(" + " ".join([_str(ctx, e) for e in v.value]) + ")")
+DIRECTIVES = frozenset("asdf^")
+
+
+def aesthetic(ctx: Context, arg: Atom) -> str:
+    return arg.value if arg.type is STRING else _str(ctx, arg, False)
+
+
+def decimal(ctx: Context, arg: Atom) -> str:
+    return str(arg.value) if arg.type is INTEGER else _str(ctx, arg, False)
+
+
+def fixed(ctx: Context, arg: Atom) -> str:
+    return str(float(arg.value))
+
+
+CONVERTERS = {"a": aesthetic, "s": _str, "d": decimal, "f": fixed}
+
+
+def compile_format(control: str) -> tuple[Any, list]:
+    # (template, converters), or (None, parts) for render_format
+    if (compiled := FORMATS.get(control)) is not None:
+        return compiled
+
+    parts, _ = parse_format(control, 0, False)
+    if all(part.__class__ is str or part[0] in CONVERTERS for part in parts):
+        template = "".join(
+            part.replace("{", "{{").replace("}", "}}") if part.__class__ is str else "{}"
+            for part in parts
+        )
+        compiled = (template, [CONVERTERS[part[0]] for part in parts if part.__class__ is not str])
+    else:
+        compiled = (None, parts)
+
+    if len(FORMATS) >= FORMATS_SIZE:
+        FORMATS.clear()
+    FORMATS[control] = compiled
+    return compiled
+
+
+def parse_format(control: str, i: int, nested: bool) -> tuple[list, int]:
+    # literal text is a str, a directive a (letter, parts of ~{ ~}) tuple
+    parts = []
+    literal = []
+    while (j := control.find("~", i)) != -1 and j + 1 < len(control):
+        literal.append(control[i:j])
+        directive = control[j + 1].lower()
+        i = j + 2
+
+        if directive == "%":
+            literal.append("\n")
+        elif directive == "~":
+            literal.append("~")
+        elif directive in DIRECTIVES or directive == "{":
+            if text := "".join(literal):
+                parts.append(text)
+            literal = []
+
+            if directive == "{":
+                inner, i = parse_format(control, i, True)
+                parts.append(("{", inner))
+            else:
+                parts.append((directive, None))
+        elif directive == "}" and nested:
+            if text := "".join(literal):
+                parts.append(text)
+            return parts, i
+        else:
+            raise Exception(f"Unknown format directive ~{control[j + 1]}")
+
+    if nested:
+        raise Exception("Format ~{ is missing its ~}")
+
+    if text := "".join(literal) + control[i:]:
+        parts.append(text)
+
+    return parts, len(control)
+
+
+def render_format(ctx: Context, parts: list, args: Sequence[Atom], i: int, out: list) -> int:
+    # appends the text for parts to out and returns the next unused argument
+    for part in parts:
+        if part.__class__ is str:
+            out.append(part)
+            continue
+
+        directive, inner = part
+        if directive == "^":
+            if i >= len(args):
+                return i
+            continue
+
+        if i >= len(args):
+            raise Exception("Not enough arguments for format")
+        arg = args[i]
+        i += 1
+
+        if directive != "{":
+            out.append(CONVERTERS[directive](ctx, arg))
         else:
-            print(v.value)
+            # ~{ ~} repeats its parts over the elements of one list argument
+            items = list(iterate_over_atom(ctx, arg))
+            j = 0
+            while j < len(items):
+                k = render_format(ctx, inner, items, j, out)
+                if k == j:
+                    break
+                j = k
+
+    return i
+
+
+def _format(ctx: Context, stdout: Atom, fstring: Atom, *args: list[Atom]) -> Atom:
+    # (format t ...) prints, (format nil ...) only returns the string and
+    # (format stream ...) writes to a string output stream
+    template, compiled = compile_format(fstring.value)
+    if template is not None:
+        if len(args) < len(compiled):
+            raise Exception("Not enough arguments for format")
+        out = template.format(*[convert(ctx, arg) for convert, arg in zip(compiled, args)])
+    else:
+        out = []
+        render_format(ctx, compiled, args, 0, out)
+        out = "".join(out)
+
+    if stdout.type is STREAM:
+        stdout.value.write(out)
+    elif stdout != NIL:
+        ctx.Output().Write(out)
+
+    return Atom(value=out, type=STRING)
+
+
+def make_string_output_stream(ctx: Context) -> Atom:
+    return Atom(value=io.StringIO(), type=STREAM)
+
+
+def get_output_stream_string(ctx: Context, stream: Atom) -> Atom:
+    # returns what was written so far and empties the stream
+    if stream.type is not STREAM or stream.value.__class__ is not io.StringIO:
+        raise Exception(f"{_str(ctx, stream)} is not a string output stream")
+    out = stream.value.getvalue()
+    stream.value.seek(0)
+    stream.value.truncate()
+    return Atom(value=out, type=STRING)
+
+
+def write_string(ctx: Context, string: Atom, stream: Atom = None) -> Atom:
+    if stream is not None and stream.type is STREAM:
+        stream.value.write(string.value)
+    else:
+        ctx.Output().Write(string.value)
+
+    return string
+
+
+def finish_output(ctx: Context) -> Atom:
+    # writes out everything buffered by print and format so far
+    ctx.Output().Flush()
+    return NIL
+
+
+def with_output_to_string(ctx: Context, args: Expression, *body: list[Expression]) -> Atom:
+    # (with-output-to-string (var) body...) binds var to a string output
+    # stream and returns everything written to it
+    scope = Context(parent=ctx)
+    stream = make_string_output_stream(ctx)
+    scope.Set(args.value[0].value, stream)
+
+    for b in body:
+        b(scope)
+
+    return get_output_stream_string(ctx, stream)
+
+
+def with_output_to_string_form(args: list[Atom]) -> Expression:
+    # the same as a let around the body, which is how the compilers build it
+    var = args[0].value[0]
+    stream = Expression([symbol("make-string-output-stream")])
+    return Expression(
+        [
+            symbol("let"),
+            Expression([Expression([var, stream])]),
+            *args[1:],
+            Expression([symbol("get-output-stream-string"), var]),
+        ]
+    )
+
+
+def sequence_type(kind: Atom) -> str:
+    return str(kind.value).upper()
+
+
+def concatenate(ctx: Context, kind: Atom, *sequences: list[Atom]) -> Atom:
+    # (concatenate 'string a b ...) joins in one pass; 'list and 'vector
+    # join the elements of any sequences
+    result = sequence_type(kind)
+    if result == "STRING":
+        return Atom(
+            value="".join([s.value if s.type is STRING else _str(ctx, s, False) for s in sequences]),
+            type=STRING,
+        )
+
+    items = list(chain.from_iterable(iterate_over_atom(ctx, s) for s in sequences))
+    if result == "LIST":
+        return build_list(items)
+    if result in ("VECTOR", "ARRAY"):
+        return make_array(items)
+
+    raise Exception(f"Cannot concatenate into a {kind.value}")
+
+
+def subseq(ctx: Context, sequence: Atom, start: Atom, end: Atom = None) -> Atom:
+    i = start.value
+    j = None if end is None or end is NIL else end.value
+
+    if sequence.type is STRING or sequence.type is ARRAY:
+        size = len(sequence.value)
+        if not 0 <= i <= (size if j is None else j) <= size:
+            raise Exception("Index Out of Bounds")
+        return Atom(value=sequence.value[i:j], type=sequence.type)
+
+    # islice rejects negative bounds itself, so check before walking
+    if i < 0 or (j is not None and j < i):
+        raise Exception("Index Out of Bounds")
+    items = list(islice(iterate_over_atom(ctx, sequence), i, j))
+    if j is not None and len(items) != j - i:
+        raise Exception("Index Out of Bounds")
+    return build_list(items)
+
+
+def string_split(ctx: Context, string: Atom, separator: Atom = None) -> Atom:
+    # splits on runs of whitespace unless a separator is given
+    if separator is not None and separator.value == "":
+        raise Exception("The separator of string-split cannot be empty")
+    parts = string.value.split(None if separator is None else separator.value)
+    return build_list([Atom(value=p, type=STRING) for p in parts])
+
+
+def string_join(ctx: Context, strings: Atom, separator: Atom = None) -> Atom:
+    glue = "" if separator is None else separator.value
+    return Atom(
+        value=glue.join(
+            [s.value if s.type is STRING else _str(ctx, s, False) for s in iterate_over_atom(ctx, strings)]
+        ),
+        type=STRING,
+    )
+
+
+MODES = {"INPUT": "r", "OUTPUT": "w", "APPEND": "a"}
+
+
+def open_file(ctx: Context, path: Atom, direction: Atom = None) -> Atom:
+    # (open path ['input | 'output | 'append]) returns a file stream
+    mode = "r" if direction is None else MODES.get(sequence_type(direction))
+    if mode is None:
+        raise Exception(f"Unknown direction {direction.value}")
+
+    return Atom(value=open(path.value, mode, encoding="utf-8"), type=STREAM)
+
+
+def close(ctx: Context, stream: Atom) -> Atom:
+    stream.value.close()
+    return T
+
+
+def with_open_file(ctx: Context, args: Expression, *body: list[Expression]) -> Atom:
+    # (with-open-file (var path [direction]) body...) binds var to the open
+    # file and closes it when the body is done, even if it raises
+    var, *spec = args.value
+    scope = Context(parent=ctx)
+    stream = open_file(ctx, *[s(ctx) for s in spec])
+    scope.Set(var.value, stream)
+
+    try:
+        result = NIL
+        for b in body:
+            result = b(scope)
+        return result
+    finally:
+        stream.value.close()
+
+
+def read_line(ctx: Context, stream: Atom, eof_error: Atom = T, eof_value: Atom = NIL) -> Atom:
+    # (read-line stream [eof-error-p [eof-value]]) returns the next line
+    # without its newline; at the end of the file it raises, or returns
+    # eof-value if eof-error-p is nil
+    line = stream.value.readline()
+    if not line:
+        if eof_error is NIL:
+            return eof_value
+        raise Exception(f"End of file on {_str(ctx, stream)}")
+
+    return Atom(value=line[:-1] if line[-1] == "\n" else line, type=STRING)
+
+
+def file_lines(ctx: Context, path: Atom) -> Atom:
+    # (file-lines path) is read a line at a time as it is iterated, and
+    # reopened by each dolist over it, so files of any size take constant
+    # memory
+    name = path.value
+
+    def lines() -> Iterator[Atom]:
+        with open(name, encoding="utf-8") as f:
+            for line in f:
+                yield Atom(value=line[:-1] if line[-1] == "\n" else line, type=STRING)
+
+    return lazy(lines)
+
+
+def read_file_bytes(ctx: Context, path: Atom) -> Atom:
+    # (read-file-bytes path) is a read only byte array over the file mapped
+    # into memory, so nothing is copied, not even by subseq and vslice
+    with open(path.value, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            return Atom(value=memoryview(b""), type=ARRAY)
+
+    return Atom(value=memoryview(mapped), type=ARRAY)
+
+
+def write_lines(ctx: Context, destination: Atom, lines: Atom) -> Atom:
+    # (write-lines path-or-stream-or-t sequence) writes each element on a
+    # line of its own, strings as they are. A path is created or truncated
+    rows = (
+        (s.value if s.type is STRING else _str(ctx, s, False)) + "\n"
+        for s in iterate_over_atom(ctx, lines)
+    )
+
+    if destination is T:
+        write = ctx.Output().Write
+        for row in rows:
+            write(row)
+    elif destination.type is STREAM:
+        destination.value.writelines(rows)
+    elif destination.type is STRING:
+        with open(destination.value, "w", encoding="utf-8") as f:
+            f.writelines(rows)
     else:
-        print(v)
+        raise Exception(f"{_str(ctx, destination)} is not a path or stream")
+
+    return NIL
+
+
+# a lazy sequence holds a function that makes a new iterator of atoms each
+# time it is walked, so it can be walked more than once and nothing is kept.
+# Everything that takes a sequence reads it through iterate_over_atom, and
+# (concatenate 'list seq) realizes one. A whole walk happens inside one
+# builtin call, so under a budget it is charged a slice of items at a time
+
+
+def lazy(function: Callable[[], Iterator[Atom]]) -> Atom:
+    def walk() -> Iterator[Atom]:
+        if (budget := BUDGET.get()) is None:
+            return function()
+        return charged(budget, function())
+
+    return Atom(value=walk, type=SEQUENCE)
+
+
+def charged(budget: Budget, items: Iterator[Atom]) -> Iterator[Atom]:
+    count = 0
+    for item in items:
+        yield item
+        count += 1
+        if count == budget.slice:
+            count = 0
+            budget.Charge(budget.slice)
+
+
+def _range(ctx: Context, start: Atom, end: Atom = None, step: Atom = None) -> Atom:
+    # (range end) or (range start end [step]), like python
+    if end is None:
+        numbers = range(start.value)
+    else:
+        numbers = range(start.value, end.value, 1 if step is None else step.value)
+
+    return lazy(lambda: map(integer, numbers))
+
+
+def lazy_map(ctx: Context, function: Atom, sequence: Atom) -> Atom:
+    return lazy(lambda: (function(ctx, item) for item in iterate_over_atom(ctx, sequence)))
+
+
+def lazy_filter(ctx: Context, function: Atom, sequence: Atom) -> Atom:
+    return lazy(lambda: (item for item in iterate_over_atom(ctx, sequence) if function(ctx, item) != NIL))
 
+
+def take(ctx: Context, n: Atom, sequence: Atom) -> Atom:
+    return lazy(lambda: islice(iterate_over_atom(ctx, sequence), n.value))
+
+
+def drop(ctx: Context, n: Atom, sequence: Atom) -> Atom:
+    return lazy(lambda: islice(iterate_over_atom(ctx, sequence), n.value, None))
+
+
+def iterate(ctx: Context, function: Atom, start: Atom) -> Atom:
+    # (iterate fn x) is the infinite sequence x, (fn x), (fn (fn x)) ...
+    def items() -> Iterator[Atom]:
+        item = start
+        while True:
+            yield item
+            item = function(ctx, item)
+
+    return lazy(items)
+
+
+def _print(ctx: Context, v: Atom) -> Atom:
+    ctx.Output().Write(_str(ctx, v) + "\n")
     return NIL
 
 
+def robert(ctx: Context, n: Atom) -> Atom:
+    ctx.Output().Write("woof\n" * n.value + "\n")
+    return NIL
+
+
+def arithmetic(operation: Callable, unary: Callable = None) -> Callable:
+    # two arguments take the straight path; more fold left without building
+    # a list, and a single argument is negated or inverted like common lisp
+    def function(_ctx: Context, a: Atom, b: Atom = None, *rest: Atom) -> Atom:
+        if b is None:
+            return box(unary(a.value)) if unary else a
+
+        result = operation(a.value, b.value)
+        for c in rest:
+            result = operation(result, c.value)
+
+        return box(result)
+
+    return function
+
+
+def comparison(operation: Callable) -> Callable:
+    def function(_ctx: Context, a: Atom, b: Atom, *rest: Atom) -> Atom:
+        if not operation(a.value, b.value):
+            return NIL
+
+        for c in rest:
+            if not operation(b.value, c.value):
+                return NIL
+            b = c
+
+        return T
+
+    return function
+
+
+NUMERIC = {
+    "+": arithmetic(op.add),
+    "-": arithmetic(op.sub, op.neg),
+    "*": arithmetic(op.mul),
+    "/": arithmetic(op.truediv, lambda a: 1 / a),
+    "//": arithmetic(op.floordiv),
+    "%": arithmetic(op.mod),
+    "rem": arithmetic(op.mod),
+    ">": comparison(op.gt),
+    "<": comparison(op.lt),
+    ">=": comparison(op.ge),
+    "<=": comparison(op.le),
+    "=": comparison(op.eq),
+}
+
+
+def fold(args: list[Atom]) -> Atom:
+    # a numeric operator applied only to number literals is evaluated once,
+    # at parse time; anything that would raise is left for run time
+    if args and args[0].type is SYMBOL and (function := NUMERIC.get(args[0].value)):
+        if len(args) > 1 and all(a.type is INTEGER or a.type is FLOAT for a in args[1:]):
+            try:
+                result = function(None, *args[1:])
+            except (ArithmeticError, TypeError):
+                return Expression(args)
+
+            if result.type is INTEGER or result.type is FLOAT:
+                return result
+
+    return Expression(args)
+
+
 reserved = {
     "defun": defun,
     "if": _if,
@@ -300,11 +1154,17 @@ reserved = {
     "cond": cond,
     "lambda": _lambda,
     "dolist": dolist,
+    "defun-memo": defun_memo,
+    "profile": profile,
+    "pdolist": pdolist,
+    "with-output-to-string": with_output_to_string,
+    "with-open-file": with_open_file,
 }
 
 
-def STD_LIB() -> Context:
+def STD_BUILTINS() -> dict[str, Atom]:
     builtins = dict(reserved)
+    builtins.update(NUMERIC)
     builtins.update(
         {
             "T": T,
@@ -315,49 +1175,80 @@ def STD_LIB() -> Context:
             "aref": aref,
             "elt": elt,
             "format": _format,
+            "make-string-output-stream": make_string_output_stream,
+            "get-output-stream-string": get_output_stream_string,
+            "write-string": write_string,
+            "finish-output": finish_output,
+            "open": open_file,
+            "close": close,
+            "read-line": read_line,
+            "file-lines": file_lines,
+            "read-file-bytes": read_file_bytes,
+            "write-lines": write_lines,
+            "range": _range,
+            "lazy-map": lazy_map,
+            "lazy-filter": lazy_filter,
+            "take": take,
+            "drop": drop,
+            "iterate": iterate,
+            "concatenate": concatenate,
+            "subseq": subseq,
+            "string-split": string_split,
+            "string-join": string_join,
             "list": _list,
             "car": car,
             "cdr": cdr,
             "cons": cons,
-            ">": lambda ctx, a, b: T if a(ctx).value > b(ctx).value else NIL,
-            "<": lambda ctx, a, b: T if a(ctx).value < b(ctx).value else NIL,
-            ">=": lambda ctx, a, b: T if a(ctx).value >= b(ctx).value else NIL,
-            "<=": lambda ctx, a, b: T if a(ctx).value <= b(ctx).value else NIL,
-            "=": lambda ctx, a, b: T if a(ctx).value == b(ctx).value else NIL,
+            "length": length,
+            "make-hash-table": make_hash_table,
+            "gethash": gethash,
+            "remhash": remhash,
+            "maphash": maphash,
+            "hash-table-count": hash_table_count,
+            "append": append,
+            "memo-stats": memo_stats,
+            "pmap": pmap,
+            "vadd": vadd,
+            "vmul": vmul,
+            "vsum": vsum,
+            "vdot": vdot,
+            "vmap": vmap,
+            "vslice": vslice,
             "and": lambda _, a, b: T if (a != NIL and b != NIL) else NIL,
             "or": lambda _, a, b: T if (a != NIL or b != NIL) else NIL,
-            "atom": lambda _, a: T if a.type != TokenType.LIST else NIL,
-            "caar": lambda ctx, a: car(ctx, car(ctx, a), a),
-            "cadr": lambda ctx, a: car(ctx, cdr(ctx, a), a),
-            "cdar": lambda ctx, a: cdr(ctx, car(ctx, a), a),
-            "cddr": lambda ctx, a: cdr(ctx, cdr(ctx, a), a),
-            "caaar": lambda ctx, a: car(ctx, car(ctx, car(ctx, a), a)),
-            "caadr": lambda ctx, a: car(ctx, car(ctx, cdr(ctx, a), a)),
-            "cadar": lambda ctx, a: car(ctx, cdr(ctx, car(ctx, a), a)),
-            "caddr": lambda ctx, a: car(ctx, cdr(ctx, cdr(ctx, a), a)),
-            "cdaar": lambda ctx, a: cdr(ctx, car(ctx, car(ctx, a), a)),
-            "cdadr": lambda ctx, a: cdr(ctx, car(ctx, cdr(ctx, a), a)),
-            "cddar": lambda ctx, a: cdr(ctx, cdr(ctx, car(ctx, a), a)),
-            "cdddr": lambda ctx, a: cdr(ctx, cdr(ctx, cdr(ctx, a), a)),
+            "atom": lambda _, a: T if a.type is not LIST else NIL,
+            "caar": lambda ctx, a: car(ctx, car(ctx, a)),
+            "cadr": lambda ctx, a: car(ctx, cdr(ctx, a)),
+            "cdar": lambda ctx, a: cdr(ctx, car(ctx, a)),
+            "cddr": lambda ctx, a: cdr(ctx, cdr(ctx, a)),
+            "caaar": lambda ctx, a: car(ctx, car(ctx, car(ctx, a))),
+            "caadr": lambda ctx, a: car(ctx, car(ctx, cdr(ctx, a))),
+            "cadar": lambda ctx, a: car(ctx, cdr(ctx, car(ctx, a))),
+            "caddr": lambda ctx, a: car(ctx, cdr(ctx, cdr(ctx, a))),
+            "cdaar": lambda ctx, a: cdr(ctx, car(ctx, car(ctx, a))),
+            "cdadr": lambda ctx, a: cdr(ctx, car(ctx, cdr(ctx, a))),
+            "cddar": lambda ctx, a: cdr(ctx, cdr(ctx, car(ctx, a))),
+            "cdddr": lambda ctx, a: cdr(ctx, cdr(ctx, cdr(ctx, a))),
         }
     )
     builtins.update(
         Context.Build(
             {
-                "+": lambda *x: reduce(op.add, x),
-                "-": lambda *x: reduce(op.sub, x),
-                "*": lambda *x: reduce(op.mul, x),
-                "/": lambda *x: reduce(op.truediv, x),
-                "//": lambda *x: reduce(op.floordiv, x),
-                "%": lambda *x: reduce(lambda a, b: a % b, x),
-                "rem": lambda *x: reduce(lambda a, b: a % b, x),
                 "abs": abs,
-                "append": lambda a, v: a.append(v),
-                "length": lambda x: len(x),
             }
         )
     )
     builtins.update(Context.Build(STD_MATH()))
-    builtins.update(Context.Build({"robert": lambda n: print("woof\n" * n)}))
+    builtins.update({"robert": robert})
+
+    return builtins
 
-    return Context(parent=Context(scope=builtins, builtin=True))
+
+# built once and shared by every context STD_LIB makes. Each context gets its
+# own builtin layer over the shared scope, copied if a builtin is setf'd, so
+# profiling, restricting or changing one leaves the rest alone
+BUILTINS = STD_BUILTINS()
+
+
+def STD_LIB() -> Context:
+    return Context(parent=Context(scope=BUILTINS, builtin=True))